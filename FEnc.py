@@ -1,371 +1,47 @@
-import sys, os, subprocess, re, json, argparse
-import datetime as dt
-from typing import Self
+import sys, os
 from enum import Enum
-from pathlib import Path, PurePath
+from collections import deque
+from collections.abc import Mapping
+import datetime as dt
+import FEncCore
+from FEncCore import MediaType, Encoders, VideoPresets, AudioPresets, PresetCommands, UserPresets, MediaFiles, JobState, EncodeJobs, FFmpeg, Event, Events, MediaLog, Metrics, JobJournal, log, VERSION
+
+if __name__ == "__main__" and FEncCore.is_headless(sys.argv[1:]):
+    # headless modes never import wx, they have to start fast on machines without a display
+    sys.exit(FEncCore.cli(sys.argv[1:]))
+
 import wx
 import wx.richtext as rt
 import wx.propgrid as pg
 import wx.adv as adv
 
-class MediaType(Enum):
-    NONE  =    -1, 'Not media'
-    VIDEO =    0,  'Video'
-    IMAGE =    1,  'Image(s)'
-    SEQUENCE = 2,  'Sequence'
-    AUDIO =    3,  'Audio'
-    DATA =     4,  'Data'
-
-    def __init__(self, id: int, doc: str):
-        self.id = id
-        self.doc = doc
-
-class Encoders():
-
-    Collection = []
-    ClassName = 'Encoder'
-    video_filters = {
-        'Scale filter': True,
-        'Scale': {
-            'ffoption': '-???', 
-            'values':   ['-1', '320', '480', '720', '1080', '2160'],
-            'current':  '-1',
-            'doc':      'Scale video',
-            'fixed':    False,
-        },
-        'Scale algo': {
-            'ffoption': '-???', 
-            'values':   ['bilinear', 'bicubic', 'bicublin', 'gauss', 'sinc', 'lanczos',],
-            'current':  'bicubic',
-            'doc':      'Scaling algorythm',
-            'fixed':    False,
-        },
-    }
-    audio_filters = {
-        'Volume filter': True,
-        'Volume': {
-            'name':     'Volume',
-            'ffoption': '-???', 
-            'values':   ['25', '50', '75', '100', '125', '150'],
-            'current':  '100',
-            'doc':      'Change audio volume',
-            'fixed':    False,
-        }
-    }
+class SourcesList(wx.ListCtrl):
 
+    # virtual list, rows are painted straight from MediaFiles.Collection
     def __init__(self, *args, **kwargs):
-        self.index = Encoders.Count()
-        self.name: str = kwargs.get('name')
-        self.type: str = kwargs.get('type')
-        self.system: bool = kwargs.get('system')
-        self.general: list = kwargs.get('general')
-        self.threading: list = kwargs.get('threading')
-        self.formats: list = kwargs.get('formats')
-        self.audio_codecs: list = kwargs.get('audio_codecs')
-        self.colorcodings: dict = kwargs.get('colorcodings')
-        self.options: dict = kwargs.get('options')
-        if self.type == MediaType.VIDEO:
-            self.options.update(self.video_filters)
-        elif self.type == MediaType.AUDIO:
-            self.options.update(self.audio_filters)
-
-    @classmethod
-    def Add(cls, *args, **kwargs):
-        cls.Collection.append(cls(*args, **kwargs))
-
-    @classmethod
-    def ByIndex(cls, index: int):
-        return cls.Collection[index]
-
-    @classmethod
-    def ByName(cls, name: str):
-        for preset in cls.Collection:
-            if preset.name == name:
-                return preset
-        return None
-
-    @classmethod
-    def Count(cls) -> int:
-        return len(cls.Collection)
-    
-    @classmethod
-    def Names(cls, type: MediaType) -> list:
-        return [enc.name for enc in cls.Collection if enc.type == type and enc.system == False]
-
-class VideoPresets():
-
-    Collection = []
-    ClassName = 'Video preset'
-    wx_color_sys = wx.Colour(80,10,10)
-    wx_color = wx.Colour(80,80,80)  
-
-    def __init__(self, name: str, encoder: Encoders, default_format: str, system: bool = False):
-        if encoder.type == MediaType.VIDEO:
-            self.name = name
-            self.index = VideoPresets.Count()
-            self.system = system
-            self.encoder = encoder
-            self.encoder_options = encoder.options
-            self.default_format = default_format
-            self.options = self.encoder.options
-            list_count = app.frame.list_vp.GetCount()
-            app.frame.list_vp.InsertItems([self.name], list_count)
-            if self.system: app.frame.list_vp.SetItemForegroundColour(list_count, self.wx_color_sys) 
-        else:
-            raise Exception('You are trying to assing a non-video Encoder to a video preset.')
-
-    @classmethod
-    def Add(cls, name: str, encoder: Encoders, default_format: str, system: bool = False):
-        cls.Collection.append(cls(name, encoder, default_format, system))
-
-    @classmethod
-    def GetPresetByName(cls, name: str) -> Self:
-        for preset in cls.Collection:
-            if preset.name == name:
-                return preset
-        return None
-            
-    @classmethod
-    def GetPresetByIndex(cls, index: int) -> Self:
-        return cls.Collection[index]
-    
-    @classmethod
-    def Count(cls) -> int:
-        return len(cls.Collection)
-    
-    @classmethod
-    def NameList(cls) -> list:
-        return [preset.name for preset in cls.Collection]
-
-    def SetVideoEncoder(self, encoder: Encoders) -> Self:
-        self.encoder = encoder
-        self.system = encoder.system
-        self.editable = True
-        self.encoder_options = encoder.options
-        self.default_format = encoder.formats[0]
-        return self
-
-    def GetValueIndex(self, options_list: list, suboption_name: str) -> int:
-        for i, suboption in enumerate(options_list):
-            if suboption['name'] == suboption_name:
-                return i
-
-class AudioPresets():
-
-    Collection = []
-    ClassName = 'Audio preset'
-    wx_color_sys = wx.Colour(80,10,10)
-    wx_color = wx.Colour(80,80,80)  
-
-    def __init__(self, name: str, encoder: Encoders, default_format: str, system: bool = False, editable: bool = True):
-        if encoder.type == MediaType.AUDIO:
-            self.name = name
-            self.index = AudioPresets.Count()
-            self.system = system
-            self.editable = editable
-            self.encoder = encoder
-            self.encoder_options = encoder.options
-            self.default_format = default_format
-            list_count = app.frame.list_ap.GetCount()
-            app.frame.list_ap.InsertItems([self.name], list_count)
-            if self.system: app.frame.list_ap.SetItemForegroundColour(list_count, self.wx_color_sys) 
+        wx.ListCtrl.__init__(self, *args, **kwargs)
+        self.status: dict[int, str] = {} # job state or progress by media id
+
+    def OnGetItemText(self, item: int, column: int) -> str:
+        media = MediaFiles.GetByIndex(item)
+        if column == 0:
+            return str(media.id)
+        elif column == 1:
+            return media.filepath
+        elif column == 2:
+            return media.type.doc
+        elif column == 3:
+            names = [media.video_preset.name if media.video_preset is not None else 'Not set']
+            return ' + '.join(names + [x.name for x, _ in media.outputs if x is not None])
+        elif column == 4:
+            names = [media.audio_preset.name if media.audio_preset is not None else 'Not set']
+            return ' + '.join(names + [x.name for _, x in media.outputs if x is not None])
         else:
-            raise Exception('You are trying to assing a non-audio Encoder to a video preset.')
+            return self.status.get(media.id, '')
 
-    @classmethod
-    def Add(cls, name: str, encoder: Encoders, default_format: str, system: bool = False, editable: bool = True):
-        cls.Collection.append(cls(name, encoder, default_format, system, editable))
-
-    @classmethod
-    def ByName(cls, name: str) -> Self:
-        for preset in cls.Collection:
-            if preset.name == name:
-                return preset
-            return None
-            
-    @classmethod
-    def ByIndex(cls, index: int) -> Self:
-        return cls.Collection[index]
-    
-    @classmethod
-    def Count(cls) -> int:
-        return len(cls.Collection)
-    
-    @classmethod
-    def Names(cls) -> list:
-        return [preset.name for preset in cls.Collection]
-    
-    def SetAudioEncoder(self, encoder: Encoders) -> Self:
-        self.encoder = encoder
-        self.system = encoder.system
-        self.editable = True
-        self.encoder_options = encoder.options
-        self.default_format = encoder.formats[0]
-        return self
-
-class MediaFiles():
-
-    Collection: list[Self] = []
-
-    def __init__(self, filepath: str):
-        self.id = MediaFiles.Count()+1 # starting at 1 to correspond to the list
-        self.origpath = filepath
-        self.filepath = filepath
-        self.filename = os.path.basename(filepath)
-        self.extension = PurePath(self.filepath).suffix
-        self.basename = PurePath(self.filepath).stem
-        self.out_basename = self.basename
-        self.out_framerate = 30
-        self.video_preset = None
-        self.audio_preset = None
-        self.probe()
-        self.detect_type()
-        app.frame.list_sources.Append([self.id, self.filepath, self.type.doc, 'Not set', 'Not set']) 
-        self.log_panel = app.frame.log_add(self.filename, self)
-        app.frame.flog(text='File', file=self.filename, end='added.')
-        app.frame.flog(tab=self.log_panel, text='File', file=self.filename, end='added.')
-        print('Init: Media added:', filepath)
-
-
-    def __new__(cls, filepath: str):
-        result = None
-        if cls.GetByFilepath(filepath) is None:
-            if cls.probe_type(filepath):
-                result = super(MediaFiles, cls).__new__(cls)
-        else:
-            app.frame.flog(text='File', file=filepath, end='is already in the sources. Skipped.')
-        return result
-   
-    @classmethod
-    def Add(cls, filepath: str):
-        item = cls(filepath)
-        if item is not None:
-            cls.Collection.append(item)
-
-    @classmethod
-    def probe_type(cls, filename: str) -> bool:
-        print('type probe')
-        probe_param = [
-            ffmpeg.ffprobeexe,
-            '-v', 'error',
-            '-hide_banner',
-            filename]
-        try:
-            probe = subprocess.check_output(probe_param, encoding='utf-8')
-        except:
-            app.frame.flog(text=f'FFmpeg did not recognize', file=os.path.basename(filename), end='as media file')
-            return False
-        else:
-            return True
-
-    def probe(self, sequence_param: list = None):
-        probe_param = [
-                ffmpeg.ffprobeexe,
-                '-v', 'error',
-                '-hide_banner',
-                '-show_streams',
-                '-show_format',
-                '-sexagesimal',
-                '-of', 'json',
-                self.filepath]
-        if sequence_param is not None: 
-            app.frame.flog(text='Re-probing file', file=self.filename, end='as sequence.')
-            probe_param[9:9] = sequence_param
-        else:
-            app.frame.flog(text='Probing file', file=self.filename)
-        try:
-            probe = subprocess.check_output(probe_param, encoding='utf-8')
-        except:
-            app.frame.flog(text=f'Unable to add file', file=self.filename)
-            self.format = None
-            return None
-        else:
-            p = json.loads(probe)
-            self.streams: list = p.get('streams')
-            # move/rename tags to the main level for easiers search
-            for i, stream in enumerate(self.streams):
-                if stream.get('tags', None) is not None:
-                    for itemkey, itemval in stream['tags'].items():
-                        self.streams[i]['TAG:'+itemkey.upper()] = itemval
-                    del stream['tags']
-            self.format: dict = p.get('format')
-            if self.format.get('tags', None) is not None:
-                for itemkey, itemval in self.format['tags'].items():
-                    self.format['TAG:'+itemkey.upper()] = itemval
-                del self.format['tags']
-
-    def detect_type(self):
-        # type detection from the probe
-        fn = self.format.get('format_name')
-        if has_tags(fn, ffmpeg.sequence_tags):
-            self.type = MediaType.IMAGE
-            # detect frame counter
-            rs = re.compile(r'\d{3,6}$')
-            counter_match = rs.search(self.basename)
-            if counter_match is not None:
-                self.type = MediaType.SEQUENCE
-                self.counter_length: str = len(counter_match.group())
-                self.filepath = self.filepath.replace(self.filename, '') # cut off filename
-                self.basename = self.basename.replace(counter_match.group(), f'%0{self.counter_length}d')
-                self.filename = self.basename + self.extension
-                self.filepath += self.filename # add the updated filename back
-                # re-probe as sequence now
-                self.probe(['-pattern_type', 'sequence', '-framerate', str(self.format.get('r_frame_rate', self.out_framerate)), '-start_number', '0'])
-        elif has_tags(fn, ffmpeg.formats_audio):
-            self.type = MediaType.AUDIO
-        elif has_tags(fn, ffmpeg.formats_video):
-            self.type = MediaType.VIDEO
-        else:
-            self.type = MediaType.DATA
-    
-    @classmethod
-    def GetIndex(cls, media) -> int:
-        return cls.Collection.index(media)
-    
-    @classmethod
-    def GetIdByFilepath(cls, filepath: str) -> int:
-        return cls.GetByFilepath(filepath).id
-
-    @classmethod
-    def GetByIndex(cls, index: int) -> Self:
-        return cls.Collection[index]
-
-    @classmethod
-    def GetByFilepath(cls, filepath: str) -> Self:
-        for media in cls.Collection:
-            if media.filepath == filepath:
-                return media
-        return None
-    
-    @classmethod
-    def GetIndexByFilepath(cls, filepath: str) -> int:
-        return cls.GetIndex(cls.GetByFilepath(filepath))
-
-    @classmethod
-    def Count(cls) -> int:
-        return len(cls.Collection)
-
-    @classmethod
-    def SetVideo(cls, file_name: str, preset: VideoPresets):
-        index = cls.GetIndex(cls.GetByFilepath(file_name))
-        cls.Collection[index].video_preset = preset
-
-    @classmethod
-    def SetAudio(cls, file_name: str, preset: AudioPresets):
-        index = cls.GetIndex(cls.GetByFilepath(file_name))
-        cls.Collection[index].audio_preset = preset
-
-    @classmethod
-    def Delete(cls, filepath):
-        app.frame.tree_info.DeleteAllItems()
-        media = cls.GetByFilepath(filepath)
-        file_index = cls.GetIndexByFilepath(filepath)
-        file_id = media.id
-        file_item = app.frame.item_by_fileid(str(file_id))
-        app.frame.list_sources.DeleteItem(file_item)
-        app.frame.log_pop(media.log_panel)
-        cls.Collection.pop(file_index)
-        app.frame.flog(text=f'File "{filepath}" deleted.')
+    def Sync(self):
+        self.SetItemCount(MediaFiles.Count())
+        self.Refresh()
 
 class FileDropTarget(wx.FileDropTarget): 
     # !TODO! can also respond to Ctr/Shif/Alt, it's useful for more features
@@ -376,8 +52,7 @@ class FileDropTarget(wx.FileDropTarget):
     def OnDropFiles(self, x, y, filepaths):
         app.frame.flog(text='Adding', file=len(filepaths), end='files...')
         app.frame.list_sources.Select(-1)
-        for filepath in filepaths:
-            MediaFiles.Add(filepath)
+        MediaFiles.AddMany(filepaths)
         return True
 
 class FFColor(Enum):
@@ -394,6 +69,12 @@ class FFColor(Enum):
         return self.value
 
 class MyMainFrame(wx.Frame):
+
+    wx_color_sys = wx.Colour(80,10,10)
+    wx_color = wx.Colour(80,80,80)  
+    max_log_tabs = 20 # file log pages kept open, their records stay in MediaLog anyway
+    flog_interval = 100 # ms between log flushes
+
     def __init__(self, *args, **kwargs):
         # begin wxGlade: MyFrame.__init__
         kwargs["style"] = kwargs.get("style", 0) | wx.DEFAULT_FRAME_STYLE
@@ -403,6 +84,9 @@ class MyMainFrame(wx.Frame):
         self.SetTitle(MyApp.ver)
         self.video_preset = None
         self.audio_preset = None
+        self.jobs_batch: list[EncodeJobs] = []
+        self.log_tabs: dict[int, dict] = {} # open file log pages by media id, oldest first
+        self.flog_queue: deque[tuple[dict, dict]] = deque() # (tab, record) waiting for log_flush
         _icon = wx.NullIcon
         _icon.CopyFromBitmap(wx.Bitmap("ffenc.png", wx.BITMAP_TYPE_ANY))
         self.SetIcon(_icon)
@@ -517,12 +201,13 @@ class MyMainFrame(wx.Frame):
         label_file_info = wx.StaticText(self.panel_main, wx.ID_ANY, "Source info")
         sizer_sources.Add(label_file_info, 1, wx.LEFT | wx.TOP, 5)
 
-        self.list_sources = wx.ListCtrl(self.panel_main, wx.ID_ANY, style=wx.BORDER_NONE | wx.LC_HRULES | wx.LC_REPORT) # | wx.LC_SINGLE_SEL
+        self.list_sources = SourcesList(self.panel_main, wx.ID_ANY, style=wx.BORDER_NONE | wx.LC_HRULES | wx.LC_REPORT | wx.LC_VIRTUAL) # | wx.LC_SINGLE_SEL
         self.list_sources.AppendColumn("#", format=wx.LIST_FORMAT_LEFT, width=25)
         self.list_sources.AppendColumn("File", format=wx.LIST_FORMAT_LEFT, width=320)
         self.list_sources.AppendColumn("Type", format=wx.LIST_FORMAT_LEFT, width=80)
         self.list_sources.AppendColumn("Video preset", format=wx.LIST_FORMAT_LEFT, width=80)
         self.list_sources.AppendColumn("Audio preset", format=wx.LIST_FORMAT_LEFT, width=80)
+        self.list_sources.AppendColumn("Progress", format=wx.LIST_FORMAT_LEFT, width=160)
         self.list_sources.ShowSortIndicator(0)
         sizer_sources.Add(self.list_sources, 3, wx.EXPAND | wx.LEFT | wx.TOP, 5)
 
@@ -612,11 +297,25 @@ class MyMainFrame(wx.Frame):
         self.list_sources.Bind(wx.EVT_LIST_ITEM_SELECTED, self.file_selected)
         self.list_sources.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.file_activated) # delete
         self.button_encode.Bind(wx.EVT_BUTTON, self.encode)
+        self.button_stop.Bind(wx.EVT_BUTTON, self.stop)
         self.nb_log.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.log_switched)
+        self.flog_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.log_flush, self.flog_timer)
+        self.flog_timer.Start(self.flog_interval)
 
         # Bind dnd
         dt = FileDropTarget(self.list_sources)
         self.list_sources.SetDropTarget(dt)
+
+        # Model events, anything emitted by worker threads arrives in batches on the main loop
+        Events.Marshal = wx.CallAfter
+        Events.Subscribe(Event.LOG, self.log_event)
+        Events.Subscribe(Event.PRESET_ADDED, self.preset_added)
+        Events.Subscribe(Event.PRESET_DELETED, self.preset_deleted)
+        Events.Subscribe(Event.MEDIA_ADDED, self.media_added, batch=True)
+        Events.Subscribe(Event.MEDIA_DELETED, self.media_deleted)
+        Events.Subscribe(Event.JOB_STATE, self.job_changed)
+        Events.Subscribe(Event.JOB_PROGRESS, self.job_progress, batch=True)
     
     def encode(self, event): 
         if self.list_sources.GetItemCount() > 0:
@@ -625,28 +324,112 @@ class MyMainFrame(wx.Frame):
             source_item = self.list_sources.GetFirstSelected()
             if source_item != wx.NOT_FOUND:
                 while source_item != wx.NOT_FOUND:
-                    encode_list.append([self.list_sources.GetItemText(source_item, 0), self.list_sources.GetItemText(source_item, 1)])
+                    encode_list.append(MediaFiles.GetByIndex(source_item))
                     source_item = self.list_sources.GetNextSelected(source_item)
                 
                 self.flog(text=f'Encoding {len(encode_list)} selected sources...')
             else:
                 # no selection gets all items
-                for list_item in range(self.list_sources.GetItemCount()):
-                    encode_list.append([self.list_sources.GetItemText(source_item, 0), self.list_sources.GetItemText(source_item, 1)])
+                encode_list = list(MediaFiles.Collection)
                 
                 self.flog(text=f'No sources selected. Encoding all {len(encode_list)} sources...')
             
-            for id, item in encode_list:
-                self.flog(id, text=f'Encoding...')
-                #page = self.nb_log.FindPage(tab['panel'])
-                #self.nb_log.SetSelection(page)
-
+            jobs = []
+            with Metrics.Span('encode_setup'):
+                for media in encode_list:
+                    if media.video_preset is None and media.audio_preset is None:
+                        self.flog(text='File', file=media.filename, end='has no presets assigned. Skipped.')
+                        continue
+                    jobs.append(EncodeJobs.Add(media))
+
+            if len(jobs) > 0:
+                self.jobs_batch = jobs
+                self.gauge_all.SetRange(len(jobs))
+                self.gauge_all.SetValue(0)
+                self.gauge_current.SetRange(100)
+                self.gauge_current.SetValue(0)
+                self.button_encode.Enable(False)
+                self.button_stop.Enable(True)
+                self.flog(text=f'Running {len(jobs)} jobs on {EncodeJobs.Workers} workers...')
+                EncodeJobs.Start(jobs)
+                # Start fixes the thread share of each job, so the final command lines are logged after it
+                for job in jobs:
+                    log(job.media, text='Queued', file=' '.join(job.argv))
         else:
             self.flog(error=f'No sources added.', color=wx.RED)
-        
 
-
-        notify("Encoding finished")
+    def stop(self, event):
+        self.flog(text='Stopping encoding...')
+        EncodeJobs.Cancel()
+
+    def job_progress(self, payloads: list[dict]):
+        # jobs throttle their own events, a flush only keeps the latest state of each job
+        jobs = {payload['job'].id: payload['job'] for payload in payloads}
+        for job in jobs.values():
+            item = self.item_by_media(job.media)
+            if item is not None:
+                self.list_sources.status[job.media.id] = job.progress_text()
+                self.list_sources.RefreshItem(item)
+            step = int((job.progress or 0) * 10)
+            if step > job.logged_step:
+                job.logged_step = step
+                log(job.media, text='Progress', end=job.progress_text())
+        running = [x for x in self.jobs_batch if x.state == JobState.RUNNING]
+        if len(running) > 0:
+            self.gauge_current.SetValue(round(sum(x.progress or 0 for x in running) / len(running) * 100))
+            self.frame_statusbar.SetStatusText(f'{len(running)} running: ' + ', '.join(f'{x.media.filename} {x.progress_text()}' for x in running))
+
+    def job_changed(self, job: EncodeJobs):
+        media = job.media
+        item = self.item_by_media(media)
+        if item is not None: # the source may have been deleted while its job ran
+            self.list_sources.status[media.id] = job.state.doc
+            self.list_sources.RefreshItem(item)
+        if job.state == JobState.RUNNING:
+            log(media, text='Encoding', file=media.filename, end=f'to {job.output}')
+            return
+        if job.state == JobState.DONE:
+            log(media, text='Encoded', file=job.output)
+        elif job.state == JobState.SKIPPED:
+            log(media, text='Up to date', file=job.output, end='skipped.')
+        elif job.state == JobState.FAILED:
+            log(media, error=f'Encoding failed ({job.returncode}):', end=job.errors)
+            self.flog(error='Encoding failed for', file=media.filename)
+        else:
+            log(media, text='Encoding', file=media.filename, end='cancelled.')
+        self.list_queue.Append([f'{job.state.doc}: {os.path.basename(job.output)}'])
+        finished = len([x for x in self.jobs_batch if x.state not in (JobState.QUEUED, JobState.RUNNING)])
+        self.gauge_all.SetValue(finished)
+        if finished == len(self.jobs_batch):
+            self.button_encode.Enable(True)
+            self.button_stop.Enable(False)
+            self.gauge_current.SetValue(0)
+            self.frame_statusbar.SetStatusText('Ready')
+            failed = len([x for x in self.jobs_batch if x.state == JobState.FAILED])
+            self.flog(text=f'Encoding finished: {finished - failed} of {finished} jobs succeeded.')
+            notify("Encoding finished")
+
+    def preset_added(self, preset: VideoPresets | AudioPresets):
+        preset_list = self.list_vp if preset.encoder.type == MediaType.VIDEO else self.list_ap
+        list_count = preset_list.GetCount()
+        preset_list.InsertItems([preset.name], list_count)
+        if preset.system: preset_list.SetItemForegroundColour(list_count, self.wx_color_sys) 
+
+    def media_added(self, payloads: list[dict]):
+        self.list_sources.Sync()
+        for payload in payloads:
+            media: MediaFiles = payload['media']
+            self.flog(text='File', file=media.filename, end='added.')
+            log(media, text='File', file=media.filename, end='added.')
+            print('Init: Media added:', media.origpath)
+
+    def media_deleted(self, media: MediaFiles, index: int):
+        self.tree_info.DeleteAllItems()
+        self.list_sources.SetItemState(index, 0, wx.LIST_STATE_SELECTED)
+        self.list_sources.status.pop(media.id, None)
+        self.list_sources.Sync()
+        if media.id in self.log_tabs:
+            self.log_pop(self.log_tabs[media.id])
 
     def file_selected(self, event):
         item_file = self.list_sources.GetFirstSelected()
@@ -655,10 +438,11 @@ class MyMainFrame(wx.Frame):
         media = MediaFiles.GetByFilepath(item_filepath)
         if media is not None:
             print('selected list item:', item_file, 'file id:', media.id, 'path:', item_filepath)
+            self.log_open(media, self.list_sources.GetSelectedItemCount() == 1)
             info_root_id = self.tree_info.AddRoot(media.filename)
             for stream in media.streams:
                 info_stream_id = self.tree_info.AppendItem(info_root_id, f'Stream #{stream['index']}: {stream.get('codec_type', 'unidentified')}')
-                for category, props in ffmpeg.stream_properies.items():
+                for category, props in FFmpeg.stream_properies.items():
                     info_category = self.tree_info.AppendItem(info_stream_id, category)
                     cnt = 0
                     for propkey, propname in props.items():
@@ -669,7 +453,7 @@ class MyMainFrame(wx.Frame):
                     if cnt == 0: self.tree_info.Delete(info_category)
             
             info_container_id = self.tree_info.AppendItem(info_root_id, 'Container')
-            for propkey, propname in ffmpeg.format_properties['Format'].items():
+            for propkey, propname in FFmpeg.format_properties['Format'].items():
                 val = media.format.get(propkey, None)
                 if val is not None:
                     self.tree_info.AppendItem(info_container_id, f'{propname}: {self.value_formatter(propkey, val)}')
@@ -702,13 +486,18 @@ class MyMainFrame(wx.Frame):
         pass
 
     def vp_activated(self, event):
+        # Ctrl+double click adds an extra output with this video preset and the source's audio preset
         source_item = self.list_sources.GetFirstSelected()
+        extra = wx.GetKeyState(wx.WXK_CONTROL)
         if self.video_preset is not None:
             if source_item != wx.NOT_FOUND:
                 while source_item != wx.NOT_FOUND:
                     file_name = self.list_sources.GetItemText(source_item, 1)
-                    MediaFiles.SetVideo(file_name, self.video_preset)
-                    self.list_sources.SetItem(source_item, 3, self.video_preset.name)
+                    if extra:
+                        MediaFiles.ToggleOutput(file_name, self.video_preset, MediaFiles.GetByFilepath(file_name).audio_preset)
+                    else:
+                        MediaFiles.SetVideo(file_name, self.video_preset)
+                    self.list_sources.RefreshItem(source_item)
                     source_item = self.list_sources.GetNextSelected(source_item)
             else:
                 self.video_prop_show(True)
@@ -716,13 +505,18 @@ class MyMainFrame(wx.Frame):
             raise Exception('Video preset selection was lost. This is a bug, report!')
 
     def ap_activated(self, event):
+        # Ctrl+double click adds an audio only output with this preset
         file_item = self.list_sources.GetFirstSelected()
+        extra = wx.GetKeyState(wx.WXK_CONTROL)
         if self.audio_preset is not None:
             if file_item != wx.NOT_FOUND:
                 while file_item != wx.NOT_FOUND:
                     file_name = self.list_sources.GetItemText(file_item, 1)
-                    MediaFiles.SetAudio(file_name, self.audio_preset)
-                    self.list_sources.SetItem(file_item, 4, self.audio_preset.name)
+                    if extra:
+                        MediaFiles.ToggleOutput(file_name, None, self.audio_preset)
+                    else:
+                        MediaFiles.SetAudio(file_name, self.audio_preset)
+                    self.list_sources.RefreshItem(file_item)
                     file_item = self.list_sources.GetNextSelected(file_item)
             else:
                 self.audio_prop_show(True)
@@ -779,7 +573,7 @@ class MyMainFrame(wx.Frame):
             elif optionval['fixed']:
                 enum_prop = pg.EnumProperty
                 # Enum prop restricted case, and wxpg requires int default value
-                if type(optionval['values'][0]) != dict:
+                if not isinstance(optionval['values'][0], Mapping):
                     current = optionval['values'].index(optionval['current'])
                 else:
                     for i, x in enumerate(optionval['values']):
@@ -792,7 +586,7 @@ class MyMainFrame(wx.Frame):
                 current = optionval['current']
             
             if enum_prop is not None:
-                if type(optionval['values'][0]) == dict: # if elements are dicts get the list of name keys
+                if isinstance(optionval['values'][0], Mapping): # if elements are dicts get the list of name keys
                     opt_values = [x['name'] for x in optionval['values']]
                     p = this_page.Append(enum_prop(optionkey, pg.PG_LABEL, opt_values, range(len(opt_values)), value=current))
                     p.SetHelpString(optionval['doc'])
@@ -801,10 +595,10 @@ class MyMainFrame(wx.Frame):
                         print(optionkey, 'has subops')
                         print('theres subs in', optionval['values'][current]['name'])
                         for suboption in optionval['values'][current]['suboptions']:
-                            p: pg.PGProperty = this_page.Append(pg.EditEnumProperty(suboption['name'], pg.PG_LABEL, suboption['values'], range(len(suboption['values'])), value=suboption['current']))
+                            p: pg.PGProperty = this_page.Append(pg.EditEnumProperty(suboption['name'], pg.PG_LABEL, list(suboption['values']), range(len(suboption['values'])), value=suboption['current']))
                             p.SetHelpString(suboption['doc'])
                 else: # list type
-                    p: pg.PGProperty = this_page.Append(enum_prop(optionkey, pg.PG_LABEL, optionval['values'], range(len(optionval['values'])), value=current))
+                    p: pg.PGProperty = this_page.Append(enum_prop(optionkey, pg.PG_LABEL, list(optionval['values']), range(len(optionval['values'])), value=current))
                     p.SetHelpString(optionval['doc'])
                     print(optionkey, 'added')
 
@@ -814,6 +608,7 @@ class MyMainFrame(wx.Frame):
         if event.PropertyName == 'Name':
             if event.Value != '':
                 self.video_preset.name = event.Value
+                self.list_vp.SetString(self.video_preset.index, event.Value)
         elif event.PropertyName == 'Encoder':
             # encoder option
             list_encoders = Encoders.Names(MediaType.VIDEO)
@@ -826,12 +621,12 @@ class MyMainFrame(wx.Frame):
         elif event.PropertyName in ['Color coding', 'Preset', 'Tune', 'Profile', 'Lookahead', 'Scale', 'Scale algo']:
             # top level options
             val = self.video_preset.encoder_options[event.PropertyName]['values'][event.Value] if val_int else event.Value
-            self.video_preset.encoder_options[event.PropertyName].update({'current': val})
+            self.video_preset.SetOption(event.PropertyName, val)
         elif event.PropertyName == 'Rate control':
             # options with suboptions
             opt_values = [x['name'] for x in self.video_preset.encoder_options[event.PropertyName]['values']]
             val = opt_values[event.Value] if val_int else event.Value
-            self.video_preset.encoder_options[event.PropertyName].update({'current': val})
+            self.video_preset.SetOption(event.PropertyName, val)
         elif event.PropertyName in ['Quality', 'Max quality', 'Bitrate']:
             # suboptions of Rate Control
             branch = self.video_preset.encoder_options['Rate control']
@@ -839,7 +634,8 @@ class MyMainFrame(wx.Frame):
             branch = self.video_preset.encoder_options['Rate control']['values'][index]['suboptions']
             subindex = self.video_preset.GetValueIndex(branch, event.PropertyName)
             val = branch[subindex]['values'][event.Value] if val_int else event.Value
-            self.video_preset.encoder_options['Rate control']['values'][index]['suboptions'][subindex].update({'current': val})
+            self.video_preset.SetSuboption('Rate control', self.video_preset.encoder_options['Rate control']['current'], event.PropertyName, val)
+        PresetCommands.Invalidate(self.video_preset)
         self.video_prop_show()
 
     def pg_ap_changed(self, event: pg.PropertyGridEvent):
@@ -848,6 +644,7 @@ class MyMainFrame(wx.Frame):
         if event.PropertyName == 'Name':
             if event.Value != '':
                 self.audio_preset.name = event.Value
+                self.list_ap.SetString(self.audio_preset.index, event.Value)
         elif event.PropertyName == 'Encoder':
             # encoder option
             list_encoders = Encoders.Names(MediaType.AUDIO)
@@ -860,12 +657,12 @@ class MyMainFrame(wx.Frame):
         elif event.PropertyName in ['Color coding', 'Preset', 'Tune', 'Profile', 'Lookahead', 'Volume']:
             # top level options
             val = self.audio_preset.encoder_options[event.PropertyName]['values'][event.Value] if val_int else event.Value
-            self.audio_preset.encoder_options[event.PropertyName].update({'current': val})
+            self.audio_preset.SetOption(event.PropertyName, val)
         elif event.PropertyName in ['Rate control']:
             # options with suboptions
             opt_values = [x['name'] for x in self.audio_preset.encoder_options[event.PropertyName]['values']]
             val = opt_values[event.Value] if val_int else event.Value
-            self.audio_preset.encoder_options[event.PropertyName].update({'current': val})
+            self.audio_preset.SetOption(event.PropertyName, val)
         elif event.PropertyName in ['Quality', 'Max quality', 'Bitrate']:
             # suboptions of Rate Control
             branch = self.audio_preset.encoder_options['Rate control']
@@ -873,31 +670,74 @@ class MyMainFrame(wx.Frame):
             branch = self.audio_preset.encoder_options['Rate control']['values'][index]['suboptions']
             subindex = self.audio_preset.GetValueIndex(branch, event.PropertyName)
             val = branch[subindex]['values'][event.Value] if val_int else event.Value
-            self.audio_preset.encoder_options['Rate control']['values'][index]['suboptions'][subindex].update({'current': val})
+            self.audio_preset.SetSuboption('Rate control', self.audio_preset.encoder_options['Rate control']['current'], event.PropertyName, val)
+        PresetCommands.Invalidate(self.audio_preset)
         self.audio_prop_show()
 
     def vp_save(self, event):
-        self.flog(0, 'Pretending to save video preset')
+        if self.video_preset is not None:
+            self.presets_save(self.video_preset)
 
     def vp_dup(self, event):
-        self.flog(0, 'Pretending to duplicate video preset')
+        if self.video_preset is not None and not self.video_preset.system:
+            self.video_preset = self.video_preset.Duplicate()
+            self.list_vp.SetSelection(self.video_preset.index)
+            self.video_prop_show()
+            self.presets_save(self.video_preset)
 
     def vp_del(self, event):
-        self.flog(0, 'Pretending to delete video preset')
+        if self.video_preset is not None and not self.video_preset.system:
+            self.presets_delete(self.video_preset)
 
     def ap_save(self, event):
-        self.flog(0, 'Pretending to save audio preset')
+        if self.audio_preset is not None:
+            self.presets_save(self.audio_preset)
 
     def ap_dup(self, event):
-        self.flog(0, 'Pretending to duplicate audio preset')
+        if self.audio_preset is not None and not self.audio_preset.system:
+            self.audio_preset = self.audio_preset.Duplicate()
+            self.list_ap.SetSelection(self.audio_preset.index)
+            self.audio_prop_show()
+            self.presets_save(self.audio_preset)
 
     def ap_del(self, event):
-        self.flog(0, 'Pretending to delete audio preset')
+        if self.audio_preset is not None and not self.audio_preset.system:
+            self.presets_delete(self.audio_preset)
+
+    def presets_save(self, preset: VideoPresets | AudioPresets):
+        # all presets go to one file, saving one saves the edits of the others too
+        try:
+            UserPresets.Save()
+        except OSError as e:
+            self.flog(error=f'Saving presets failed ({e.strerror})', file=UserPresets.Path)
+        else:
+            self.flog(text=f'{preset.ClassName} "{preset.name}" saved to', file=UserPresets.Path)
 
-    def log_add(self, title: str, media: MediaFiles) -> dict:
-        tab: dict[str, wx.Panel|wx.BoxSizer|rt.RichTextCtrl] = {} # {'panel':,'sizer':,'text':}
+    def presets_delete(self, preset: VideoPresets | AudioPresets):
+        try:
+            UserPresets.Delete(preset)
+        except OSError as e:
+            self.flog(error=f'Saving presets failed ({e.strerror})', file=UserPresets.Path)
+        self.flog(text=f'{preset.ClassName} "{preset.name}" deleted.')
+
+    def preset_deleted(self, preset: VideoPresets | AudioPresets, index: int):
+        if preset.encoder.type == MediaType.VIDEO:
+            self.list_vp.Delete(index)
+            if self.video_preset is preset:
+                self.video_preset = None
+                self.pg_vp.Clear()
+        else:
+            self.list_ap.Delete(index)
+            if self.audio_preset is preset:
+                self.audio_preset = None
+                self.pg_ap.Clear()
+        self.list_sources.Refresh()
+
+    def log_add(self, title: str, media: MediaFiles, select: bool = True) -> dict:
+        tab: dict[str, wx.Panel|wx.BoxSizer|rt.RichTextCtrl] = {} # {'panel':,'sizer':,'text':,'media':}
+        tab['media'] = media
         tab['panel'] = wx.Panel(self.nb_log, wx.ID_ANY)
-        self.nb_log.AddPage(tab['panel'], select=True, text=title)
+        self.nb_log.AddPage(tab['panel'], select=select, text=title)
         tab['sizer'] = wx.BoxSizer(wx.HORIZONTAL)
         tab['text'] = rt.RichTextCtrl(
             parent=tab['panel'],
@@ -908,29 +748,58 @@ class MyMainFrame(wx.Frame):
         tab['sizer'].Add(tab['text'], 1, wx.ALL | wx.EXPAND, 3)
         tab['panel'].SetSizer(tab['sizer'])
         tab['panel'].Layout()
-        page = self.nb_log.FindPage(tab['panel'])
-        self.nb_log.SetSelection(page)
+        if select:
+            page = self.nb_log.FindPage(tab['panel'])
+            self.nb_log.SetSelection(page)
         return tab
 
+    def log_open(self, media: MediaFiles, select: bool = True):
+        # file log pages are only built on demand and replay the buffered records
+        tab = self.log_tabs.get(media.id)
+        if tab is None:
+            if len(self.log_tabs) >= self.max_log_tabs:
+                self.log_pop(next(iter(self.log_tabs.values())))
+            tab = self.log_add(media.filename, media, select=False)
+            self.log_tabs[media.id] = tab
+            if media.log.spilled > 0:
+                where = f'in {media.log.spill_path}' if media.log.spill_path is not None else 'dropped'
+                self.flog(tab, text=f'{media.log.spilled} earlier lines', end=where)
+            for record in media.log.Records():
+                self.flog(tab, **record)
+        if select:
+            self.nb_log.SetSelection(self.nb_log.FindPage(tab['panel']))
+
     def log_pop(self, tab: dict):
-        self.nb_log.SetSelection(0)
-        tab['sizer'].Remove(0)
+        if tab['media'] is not None:
+            self.log_tabs.pop(tab['media'].id, None)
         pn = self.nb_log.FindPage(tab['panel'])
+        if self.nb_log.GetSelection() == pn:
+            self.nb_log.SetSelection(0)
+        tab['closed'] = True
+        tab['sizer'].Remove(0)
         self.nb_log.DeletePage(pn) 
 
     def log_switched(self, event):
         selected = self.nb_log.GetSelection()
         if selected != wx.NOT_FOUND:
+            # item -1 addresses all rows of the virtual list at once
             if selected == 0:
-                for item in range(self.list_sources.GetItemCount()):
-                    self.list_sources.Select(item, 1)
+                self.list_sources.SetItemState(-1, wx.LIST_STATE_SELECTED, wx.LIST_STATE_SELECTED)
             else:
-                for item in range(self.list_sources.GetItemCount()):
-                    self.list_sources.Select(item, 1 if item == selected-1 else 0)
-
-    def item_by_fileid(self, fileid: str):
-        item_index = self.list_sources.FindItem(start=-1,str=fileid)
-        if item_index == wx.NOT_FOUND:
+                media = next((tab['media'] for tab in self.log_tabs.values() if tab['panel'] is self.nb_log.GetPage(selected)), None)
+                item = self.item_by_media(media) if media is not None else None
+                if item is not None and not self.list_sources.IsSelected(item):
+                    self.list_sources.SetItemState(-1, 0, wx.LIST_STATE_SELECTED)
+                    self.list_sources.Select(item)
+                    self.list_sources.EnsureVisible(item)
+
+    def item_by_media(self, media: MediaFiles) -> int | None:
+        # list rows follow MediaFiles.Collection order, None once the source is deleted
+        try:
+            item_index = MediaFiles.GetIndex(media)
+        except ValueError:
+            return None
+        if item_index >= self.list_sources.GetItemCount():
             raise Exception('Internal file list error. This is a bug, report!')
         else:
             return item_index
@@ -965,127 +834,63 @@ class MyMainFrame(wx.Frame):
         else:
             return property_value
 
+    def log_event(self, media: MediaFiles = None, **kwargs):
+        # file records are buffered in media.log, only open pages get written
+        if media is None:
+            self.flog(**kwargs)
+        elif media.id in self.log_tabs:
+            self.flog(self.log_tabs[media.id], **kwargs)
+
     def flog(self, tab: dict=None, **kwargs): # kw = {'text', 'file', 'error', 'end'}
-        if tab is None: tab = self.flog_tab
-        timestamp = dt.datetime.strftime(dt.datetime.now(), '%H:%M:%S ')
-        logtxt: rt.RichTextCtrl = tab['text']
-        logtxt.MoveEnd()
-        logtxt.WriteText(timestamp)
-        if kwargs.get('text') is not None:
+        # safe from any thread, records only queue up here and log_flush writes them in batches
+        kwargs.setdefault('time', dt.datetime.now())
+        self.flog_queue.append((tab or self.flog_tab, kwargs))
+
+    def log_flush(self, event=None):
+        batches: dict[int, tuple[dict, list]] = {}
+        while len(self.flog_queue) > 0:
+            tab, record = self.flog_queue.popleft()
+            batches.setdefault(id(tab), (tab, []))[1].append(record)
+        for tab, records in batches.values():
+            if tab.get('closed'):
+                continue
+            logtxt: rt.RichTextCtrl = tab['text']
+            logtxt.Freeze()
+            logtxt.MoveEnd()
+            for record in records:
+                self.log_write(logtxt, record)
+            logtxt.MoveEnd()
+            logtxt.ScrollIntoView(logtxt.GetCaretPosition(), wx.WXK_DOWN)
+            logtxt.Thaw()
+
+    def log_write(self, logtxt: rt.RichTextCtrl, record: dict):
+        logtxt.WriteText(dt.datetime.strftime(record['time'], '%H:%M:%S '))
+        if record.get('text') is not None:
             logtxt.BeginTextColour(FFColor.TEXT.wx)
-            logtxt.WriteText(f'{kwargs['text']} ')
+            logtxt.WriteText(f'{record['text']} ')
             logtxt.EndTextColour()
-        if kwargs.get('file') is not None:
+        if record.get('file') is not None:
             logtxt.BeginTextColour(FFColor.FILE.wx)
-            logtxt.WriteText(f'{kwargs['file']} ')
+            logtxt.WriteText(f'{record['file']} ')
             logtxt.EndTextColour()
-        if kwargs.get('error') is not None:
+        if record.get('error') is not None:
             logtxt.BeginTextColour(FFColor.ERR.wx)
-            logtxt.WriteText(f'{kwargs['error']} ')
+            logtxt.WriteText(f'{record['error']} ')
             logtxt.EndTextColour()
-        if kwargs.get('end') is not None:
+        if record.get('end') is not None:
             logtxt.BeginTextColour(FFColor.TEXT.wx)
-            logtxt.WriteText(kwargs['end'])
+            logtxt.WriteText(record['end'])
             logtxt.EndTextColour()
-        logtxt.MoveEnd()
-        logtxt.ScrollIntoView(logtxt.GetCaretPosition(), wx.WXK_DOWN)
         logtxt.Newline()
-        #self.nb_log.SetSelection(tab)
 
 class MyApp(wx.App):
-    ver = 'FFEnc v0.096a'
+    ver = VERSION
     def OnInit(self):
         self.frame = MyMainFrame(None, wx.ID_ANY, "")
         self.SetTopWindow(self.frame)
         self.frame.Show()
         return True
 
-class FFmpeg():
-    formats_video = ['mp4','mov','webm','dnxhd','mxf','avi','mpeg','mpegts','dv','flv','matroska','apng','exr','gif','jpg','png','tif','dds']
-    #codecs_video =  ['prores','libx264','libx265', 'h264_nvenc','hevc_nvenc','h264_qsv','hevc_qsv','libvpx-vp9','vp9_qsv','mpeg2video','mpeg2_qsv','libx265dnxhd','mpegts','dvvideo','flv1','gif','apng','png','mjpeg','tiff','dds','HDR','WebP']
-    color_spaces =  ['bt709', 'bt2020nc', 'bt2020c', 'rgb', 'bt470bg', 'smpte170m', 'smpte240m', 'smpte2085', 'ycocg']
-    color_ranges =  ['tv', 'pc', 'mpeg', 'jpeg']
-    formats_audio = ['Video container','ac3','wav','mp3','ogg','flac','aiff','alac']
-    codecs_audio =  ['aac','ac3','flac','alac','dvaudio','pcm_s16le','pcm_s24le','pcm_s32le','pcm_f32le']
-    sequence_tags = ['image2','pipe']
-
-    # media properties interpreter, only these get displayed in info box
-    stream_properies = {
-        'Codec': { 
-            'codec_name': 'Name',
-            'codec_tag_string': 'Tag',
-            'profile': 'Profile',
-            'pix_fmt': 'Color coding',
-            'bits_per_raw_sample': 'Bit depth',
-            'bit_rate': 'Bit rate',
-            'max_bit_rate': 'Max bitrate'
-        },
-        'Dimensions': {
-            'width': 'Width',
-            'height': 'Height',
-            'sample_aspect_ratio': 'Pixel ratio',
-            'display_aspect_ratio': 'Frame ratio',
-        },
-        'Sampling': {
-            'sample_rate': 'Sampling rate',
-            'channel_layout': 'Channels'
-        },
-        'Time': {
-            'r_frame_rate': 'Frame rate',
-            'avg_frame_rate': 'Average frame rate',
-            'time_base': 'Time base',
-            'start_time': 'Start',
-            'duration': 'Duration',
-            'nb_frames': 'Frames'
-        },
-        'Color': {
-            'color_range': 'Range',
-            'color_space': 'Colorspace',
-            'color_primaries': 'Primaries',
-            'color_transfer': 'Transfer function'
-        },
-        'Tags': {
-            'TAG:LANGUAGE': 'Language',
-            'TAG:TITLE': 'Title',
-            'TAG"DURATION': 'Duration',
-            'TAG:CREATION_TIME': 'Created',
-            'TAG:ENCODER': 'Encoder',
-            'TAG:HANDLER_NAME': 'Handler',
-            'TAG:VENDOR_ID': 'Vendor'
-        }
-    }
-
-    format_properties = {
-        'Format': {
-            'format_name': 'Format name',
-            'format_long_name': 'Format long name',
-            'nb_streams': 'Nubmer of streams',
-            'start_time': 'Start',
-            'duration': 'Duration',
-            'size': 'Size',
-            'bit_rate': 'Bit rate',
-            'TAG:CREATION_TIME': 'Created',
-            'TAG:ENCODER': 'Encoder',
-            'TAG:MAJOR_BRAND': 'Brand'
-        }
-
-    }
-  
-    def __init__(self, path: str):
-        self.path = path
-        self.ffmpegexe = self.path + 'ffmpeg.exe'
-        self.ffprobeexe = self.path + 'ffprobe.exe'
-        my_file = Path(self.ffmpegexe)
-        if my_file.is_file():
-            app.frame.flog(text=f'FFmpeg executable found at {self.ffmpegexe}')
-        else:
-            app.frame.flog(text=f'FFmpeg executable not found at {self.ffmpegexe}')
-        my_file = Path(self.ffprobeexe)
-        if my_file.is_file():
-            app.frame.flog(text=f'FFprobe executable found at {self.ffprobeexe}')
-        else:
-            app.frame.flog(text=f'FFprobe executable not found at {self.ffprobeexe}')
-
 class Filter():
     pass
 
@@ -1097,507 +902,31 @@ def notify(text: str):
     adv.NotificationMessage.SetIcon(notif, feicon)
     adv.NotificationMessage.Show(notif, timeout=8)    
 
-def has_tags(text: str, tag_list: list) -> bool:
-    return any(item in text for item in tag_list)
 
 
 if __name__ == "__main__":
-    args = sys.argv
-    print(f'argumens: {args}')
+    args = FEncCore.arg_parser().parse_args(sys.argv[1:])
 
     app = MyApp(0)
     app.frame.flog(text=f'{app.ver} started.')
-    ffmpeg = FFmpeg('C:\\Program Files\\ffmpeg\\bin\\')
-
-    # Add codecs
-    set_encoders = [
-        {   #0
-            'name':            'No video',
-            'type':            MediaType.VIDEO,
-            'system':          True,
-            'options':         {
-                'ffoption': None
-            }
-        },
-        {   #1
-            'name':            'Video stream copy',
-            'type':            MediaType.VIDEO,
-            'system':          True,
-            'options':         {
-                'ffoption': '-c:v copy'
-            }
-        },
-        {   #2
-            'name':            'No audio',
-            'type':            MediaType.AUDIO,
-            'system':          True,
-            'options':         {
-                'ffoption': None
-            }
-        },
-        {   #3
-            'name':            'Audio stream copy',
-            'type':            MediaType.AUDIO,
-            'system':          True,
-            'options':         {
-                'ffoption': '-c:a copy'
-            }
-        },
-        {   #4
-            'name':            'libx264',
-            'type':            MediaType.VIDEO, 'system': False,
-            'general':         ['dr1', 'delay', 'threads'],
-            'threading':       ['other'],
-            'formats':         ['mp4', 'mov'],
-            'audio_codecs':    ['aac', 'ac3', 'mp3', 'dts', 'mp2', 'alac', 'dvaudio'],
-            'options':         {
-                'Encoder options': True,
-                'Color coding': {
-                    'ffoption': '-pix_fmt',
-                    'values': ['yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p', 'yuv420p10le', 'yuv422p10le', 'yuv444p10le', 'gray', 'gray10le'],
-                    'current': 'yuv420p',
-                    'doc': 'Pixel format/chroma subsampling mode. 10 or 16 in the names states the bitdepth.',
-                    'fixed': True
-                },
-                'Preset': {
-                    'ffoption': '-preset',
-                    'values': ['medium', 'ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'slow', 'veryslow', 'placebo'],
-                    'current': 'slow',
-                    'doc': 'Sets the encoding preset.',
-                    'fixed': False,
-                },
-                'Profile': {
-                    'ffoption': '-profile',
-                    'values': ['baseline', 'main', 'high', 'high10', 'high422', 'high444'],
-                    'current': 'high',
-                    'doc': 'Encoding profile. High10, high422 and high444 modes support 10-bit color.',
-                    'fixed': True,
-                },
-                'Encoder rate control': True,
-                'Rate control': {
-                    'values': [
-                        {
-                            'name': 'Constant quality',
-                            'ffoption': '-crf',
-                            'doc': 'Constant quality mode.',
-                            'suboptions': [
-                                {
-                                'name': 'Quality',
-                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '50'],
-                                'current': '-1',
-                                'doc': 'Selects the quality for constant quality mode.',
-                                'fixed': False,
-                                },
-                                {
-                                'name': 'Max quality',
-                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '50'],
-                                'current': '-1',
-                                'doc': 'Prevents VBV from lowering quality beyond this point.',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name':'Constant quantization',
-                            'ffoption': '-qp',
-                            'doc': 'Constant quantization mode.',
-                            'suboptions': [ 
-                                {
-                                'name': 'Quality',
-                                'values': ['-1', '5', '10', '20', '25', '30', '40', '51'],
-                                'current': '25',
-                                'doc': 'Constant quantization parameter',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'AQ mode',
-                            'ffoption': '-aq-mode',
-                            'doc': 'AQ mode',
-                            'suboptions': [
-                                {
-                                'name': 'AQ method',
-                                'values': ['-1', '0', '1', '2', '3'],
-                                'current': '-1',
-                                'doc': 'AQ method number',
-                                'fixed': True,
-                                },
-                                {
-                                'name': 'AQ strength',
-                                'values': ['-1', '0', '10', '20', '50', '100', '500'],
-                                'current': '-1',
-                                'doc': 'Reduces blocking and blurring in flat and textured areas.',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                    ],
-                    'current': 'Constant quality',
-                    'doc': 'Rate control mode',
-                    'fixed': True,
-                },
-                'Encoder tune': True,
-                'Tune': {
-                    'ffoption': '-tune',
-                    'values': ['film', 'grain', 'animation', 'zerolatency', 'fastdecode', 'stillimage'],
-                    'current': 'film', 
-                    'doc': 'Tune the encoding params.',
-                    'fixed': True,
-                },
-                'Lookahead': {
-                    'ffoption': '-rc-lookahead',
-                    'values': ['-1', '5', '10', '25', '30', '50', '100'],
-                    'current': '25',
-                    'doc': 'Number of frames to look ahead for frametype and ratecontrol.',
-                    'fixed': False,
-                },
-            }
-        },
-        {   #5
-            'name':            'h264_nvenc',
-            'type':            MediaType.VIDEO,
-            'system':          False,
-            'general':         ['dr1', 'delay', 'hardware'],
-            'threading':       ['none'],
-            'formats':         ['mp4', 'mov'],
-            'audio_codecs':    ['aac', 'ac3', 'mp3', 'dts', 'mp2', 'alac', 'dvaudio'],
-            'devices':         ['cuda', 'd3d11va'],
-            'options':         {
-                'Encoder options': True,
-                'Color coding': {
-                    'ffoption': '-pix_fmt',
-                    'values': ['yuv420p', 'yuv444p', 'yuv444p16le', 'p010le', 'p016le', 'bgr0', 'bgra', 'rgb0', 'rgba'],
-                    'current': 'yuv420p',
-                    'doc': 'Pixel format/chroma subsampling mode. 10 or 16 in the names states the bitdepth.',
-                    'fixed': False,
-                },
-                'Preset': {
-                    'ffoption': '-preset',
-                    'values': ['p1', 'p2', 'p3 ', 'p4', 'p5', 'p6', 'p7'],
-                    'current': 'p6',
-                    'doc': 'Encoding preset',
-                    'fixed': False,
-                },
-                'Profile': {
-                    'ffoption': '-profile',
-                    'values': ['baseline', 'main', 'high', 'high444p'],
-                    'current': 'high',
-                    'doc': 'Encoding profile',
-                    'fixed': True,
-                },
-                'Encoder rate control': True,
-                'Rate control': {
-                    'values': [
-                        {
-                            'name': 'Auto by preset',
-                            'ffoption': '-rc -1',
-                            'doc': 'Rate/quality controlled by the Preset',
-                        },
-                        {
-                            'name': 'Constant QP mode',
-                            'ffoption': '-rc constqp',
-                            'suboptions': [
-                                {
-                                'name': 'Quality',
-                                'ffoption': '-qp',
-                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '51'],
-                                'current': '0',
-                                'doc': 'Constant QP mode',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'Variable bitrate',
-                            'ffoption': '-rc vbr',
-                            'suboptions': [
-                                {
-                                'name':'Quality',
-                                'ffoption': '-cq',
-                                'values': ['0', '5', '10', '20', '25', '30', '40', '51'],
-                                'current': '0',
-                                'doc': 'Variable bitrate mode',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'Constant bitrate',
-                            'ffoption': '-rc cbr',
-                            'suboptions': [
-                                {
-                                'name': 'Bitrate', 
-                                'ffoption': '-v:b',
-                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
-                                'current': '8M',
-                                'doc': 'Constant bitrate mode',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'Constant bitrate low delay HQ',
-                            'ffoption': '-rc cbr_ld_hq',
-                            'suboptions': [
-                                {
-                                'name': 'Bitrate', 
-                                'ffoption': '-v:b',
-                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
-                                'current': '8M',
-                                'doc': 'Constant bitrate low delay high quality',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'Constant bitrate HQ',
-                            'ffoption': '-rc cbr_hq',
-                            'suboptions': [
-                                {
-                                'name': 'Bitrate', 
-                                'ffoption': '-v:b',
-                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
-                                'current': '8M',
-                                'doc': 'Constant bitrate high quality mode',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                        {
-                            'name': 'Variable bitrate HQ',
-                            'ffoption': '-rc vbr_hq',
-                            'suboptions': [
-                                {
-                                'name':'Quality',
-                                'ffoption': '-cq',
-                                'values': ['0', '5', '10', '20', '25', '30', '40', '51'],
-                                'current': '0',
-                                'doc': 'Variable bitrate high quality',
-                                'fixed': False,
-                                },
-                            ],
-                        },
-                    ],
-                    'current': 'Auto by preset',
-                    'doc': 'Overrides the preset rate-control',
-                    'fixed': True,
-                },
-                'Encoder tune': True,
-                'Tune': {
-                    'ffoption': '-tune',
-                    'values': ['hq', 'll', 'ull', 'lossless'],
-                    'current': 'hq',
-                    'doc': 'Sets the encoding tuning info',
-                    'fixed': True,
-                },
-                'Lookahead': {
-                    'ffoption': '-rc-lookahead',
-                    'values': ['-1', '5', '10', '25', '30', '50', '100'],
-                    'current': '25',
-                    'doc': 'Number of frames to look ahead for rate-control',
-                    'fixed': False,
-                },
-            }
-        },
-        {   #6
-            'name':            'aac',
-            'type':            MediaType.AUDIO,
-            'system':          False,
-            'general':         ['dr1', 'delay', 'small'],
-            'threading':       ['none'],
-            'formats':         ['aac', 'mp4'],
-            'sample_rates':    [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350],
-            'channel_layouts': [],
-            'sample_formats':  ['fltp'],
-            'options':         {
-                'Encoder options': True,
-                'Coder': {
-                    'ffoption': '-aac_coder', 
-                    'values': ['anmr', 'twoloop', 'fast'],
-                    'current': 'twoloop',
-                    'doc': 'Coding algorithm: ANMR, Two loop searching, Default fast search.',
-                    'fixed': True,
-                },
-                'Force M/S stereo coding': {
-                    'ffoption': '-aac_ms', 
-                    'values': ['auto', 'true', 'false'],
-                    'current': 'auto',
-                    'doc': 'Force M/S stereo coding',
-                    'fixed': True,                
-                },
-                'Intensity stereo coding': {
-                    'ffoption': '-aac_is', 
-                    'values': ['true', 'false'],
-                    'current': 'true',
-                    'doc': 'Intensity stereo coding',
-                    'fixed': True,                
-                },
-                'Perceptual noise substitution': {
-                    'ffoption': '-aac_pns', 
-                    'values': ['true', 'false'],
-                    'current': 'true',
-                    'doc': 'Perceptual noise substitution',
-                    'fixed': True,                
-                },
-                'Temporal noise shaping': {
-                    'ffoption': '-aac_tns', 
-                    'values': ['true', 'false'],
-                    'current': 'true',
-                    'doc': 'Temporal noise shaping',
-                    'fixed': True,                
-                },
-                'Long term prediction': {
-                    'ffoption': '-aac_ltp', 
-                    'values': ['true', 'false'],
-                    'current': 'false',
-                    'doc': 'Long term prediction',
-                    'fixed': True,                
-                },
-                'AAC-Main prediction': {
-                    'ffoption': '-aac_pred', 
-                    'values': ['true', 'false'],
-                    'current': 'false',
-                    'doc': 'AAC-Main prediction',
-                    'fixed': True,                
-                },
-                'Use PCEs': {
-                    'ffoption': '-aac_pce', 
-                    'values': ['true', 'false'],
-                    'current': 'false',
-                    'doc': 'Forces the use of PCEs',
-                    'fixed': True,                
-                },
-            }
-        },
-        {   #7
-            'name':            'ac3',
-            'type':            MediaType.AUDIO,
-            'system':          False,
-            'general':         ['dr1'],
-            'threading':       ['none'],
-            'formats':         ['aac', 'mp4'],
-            'sample_rates':    [48000, 44100, 32000],
-            'channel_layouts': ['mono', 'stereo', '3.0(back)', '3.0 quad(side)', 'quad 4.0', '5.0(side)', '5.0 2channels (FC+LFE)', ' 2.1 4 channels (FL+FR+LFE+BC)', '3.1', '4.1', '5.1(side)', '5.1'],
-            'sample_formats':  ['fltp'],
-            'options':         {
-                'Encoder options': True,
-                'Center Mix Level': {
-                    'ffoption': '-center_mixlev', 
-                    'values': ['0', '0.594604', '1'],
-                    'current': '0.594604',
-                    'doc': 'Center Mix Level',
-                    'fixed': False,
-                },
-                'Surround Mix Level': {
-                    'ffoption': '-surround_mixlev', 
-                    'values': ['0', '0.5', '1'],
-                    'current': '0.5',
-                    'doc': 'Surround Mix Level',
-                    'fixed': False,
-                },
-                'Mixing Level': {
-                    'ffoption': '-mixing_level', 
-                    'values': ['-1', '10', '20', '30', '50', '80', '111'],
-                    'current': '-1',
-                    'doc': 'Mixing Level',
-                    'fixed': False,
-                },
-                'Copyright Bit': {
-                    'ffoption': '-copyright', 
-                    'values': ['-1', '0', '1'],
-                    'current': '-1',
-                    'doc': 'Copyright Bit',
-                    'fixed': True,
-                },
-            }   
-        },
-        {   #8
-            'name':            'pcm_s16le',
-            'type':            MediaType.AUDIO,
-            'system':          False,
-            'general':         ['dr1', 'variable'],
-            'threading':       ['none'],
-            'formats':         ['wav', 'mov'],
-            'sample_rates':    [],
-            'channel_layouts': [],
-            'sample_formats':  ['s16'],
-            'options':         {
-                'Encoder options': False,
-            }
-        },
-    ]
-
-    for encoder in set_encoders:
-        Encoders.Add(**encoder)
-
-    set_audio_presets = [
-        {
-            'name':            'No audio',
-            'encoder':         Encoders.ByName('No audio'), 
-            'default_format':  '',
-            'system':          True,
-        },
-        {
-            'name':            'Stream copy',
-            'encoder':         Encoders.ByName('Audio stream copy'), 
-            'default_format':  '',
-            'system':          True,
-        },
-        {
-            'name':            'aac',
-            'encoder':         Encoders.ByName('aac'),
-            'default_format':  'aac',
-            'system':          False,
-        },
-        {
-            'name':            'ac3',
-            'encoder':         Encoders.ByName('ac3'),
-            'default_format':  'ac3',
-            'system':          False,
-        },
-        {
-            'name':            'pcm 16 bit',
-            'encoder':         Encoders.ByName('pcm_s16le'),
-            'default_format':  'wav',
-            'system':          False,
-        },
-    ]
-
-    for ap in set_audio_presets:
-        AudioPresets.Add(**ap)
-
-    set_video_presets = [
-        {
-            'name': 'No video',
-            'encoder': Encoders.ByName('No video'),
-            'default_format': '',
-            'system': True,
-        },
-        {
-            'name': 'Stream copy',
-            'encoder': Encoders.ByName('Video stream copy'),
-            'default_format': '',
-            'system': True,
-        },
-        {
-            'name': 'libx h264 420p cbr 8M slow',
-            'encoder': Encoders.ByName('libx264'),
-            'default_format': 'mp4',
-            'system': False,
-        },
-        {
-            'name': 'nv h264 420p Preset p6-Better',
-            'encoder': Encoders.ByName('h264_nvenc'),
-            'default_format': 'mp4',
-            'system': False,
-        },
-    ]
-
-    for vp in set_video_presets:
-        VideoPresets.Add(**vp)
+    MediaLog.SpillDir = args.log_dir
+    EncodeJobs.Workers = max(1, args.workers)
+    EncodeJobs.Segments = args.segments
+    EncodeJobs.Incremental = args.incremental
+    EncodeJobs.HashSources = args.hash_sources
+    FEncCore.set_admission(args)
+    FEncCore.ffmpeg = FFmpeg(args.ffmpeg)
+    FEncCore.load_defaults()
+    unfinished = JobJournal.Open(args.journal)
+    if len(unfinished) > 0:
+        app.frame.flog(text=f'{len(unfinished)} unfinished jobs in the journal', file=JobJournal.Path, end='run with --resume to finish them.')
+    if len(args.files) > 0:
+        MediaFiles.AddMany(args.files)
 
     app.MainLoop()
+    FEncCore.ProbeCache.Flush()
+    if args.metrics is not None:
+        Metrics.Save(args.metrics)
 
     # encoder options contain entire set (default settings)
     # but preset options contain the subset of changed options
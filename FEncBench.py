@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# FFEnc benchmarks, not tests: times the hot paths of FEncCore and prints JSON to compare between versions
+import sys, os, json, time, shutil, tempfile, argparse, platform, subprocess
+import FEncCore
+from FEncCore import MediaFiles, ImageSequences, VideoPresets, AudioPresets, PresetCommands, JobState, EncodeJobs, ProbeCache, FFmpeg, Event, Events, log, VERSION
+try:
+    import resource # cpu time and peak memory of the ffmpeg children, not on Windows
+except ImportError:
+    resource = None
+
+# stands in for ffprobe when ffmpeg is not installed, answers by the file extension
+STUB_FFPROBE = '''#!{python}
+import sys, json, os
+path = sys.argv[-1]
+ext = os.path.splitext(path)[1].lower()
+if ext == '.mp4':
+    print(json.dumps({{'streams': [{{'index': 0, 'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720, 'r_frame_rate': '25/1', 'duration': '0:00:05.000000', 'nb_frames': '125', 'tags': {{'language': 'und'}}}}, {{'index': 1, 'codec_type': 'audio', 'codec_name': 'aac', 'duration': '0:00:05.000000'}}], 'format': {{'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'duration': '0:00:05.000000', 'tags': {{'encoder': 'stub'}}}}}}))
+elif ext == '.wav':
+    print(json.dumps({{'streams': [{{'index': 0, 'codec_type': 'audio', 'codec_name': 'pcm_s16le', 'duration': '0:00:05.000000'}}], 'format': {{'format_name': 'wav', 'duration': '0:00:05.000000'}}}}))
+elif ext == '.png':
+    print(json.dumps({{'streams': [{{'index': 0, 'codec_type': 'video', 'codec_name': 'png', 'width': 320, 'height': 240}}], 'format': {{'format_name': 'png_pipe'}}}}))
+else:
+    sys.stderr.write(path + ': Invalid data found when processing input\\n')
+    sys.exit(1)
+'''
+
+# synthetic sources, name: lavfi arguments
+CLIPS = {
+    'clip.mp4': ['-f', 'lavfi', '-i', 'testsrc=duration=5:size=1280x720:rate=25', '-f', 'lavfi', '-i', 'sine=frequency=440:duration=5', '-pix_fmt', 'yuv420p', '-shortest'],
+    'tone.wav': ['-f', 'lavfi', '-i', 'sine=frequency=440:duration=5'],
+    'frame.png': ['-f', 'lavfi', '-i', 'testsrc=size=320x240', '-frames:v', '1'],
+}
+
+def make_media(folder: str, use_ffmpeg: bool, ffmpeg_path: str = None) -> str:
+    # returns the ffmpeg folder to use, the stub lives in the media folder
+    os.makedirs(folder, exist_ok=True)
+    ffmpegexe = None
+    if use_ffmpeg:
+        ffmpegexe = FFmpeg(ffmpeg_path).ffmpegexe if ffmpeg_path is not None else shutil.which('ffmpeg')
+    if ffmpegexe is not None and os.path.isfile(ffmpegexe):
+        for name, lavfi in CLIPS.items():
+            subprocess.run([ffmpegexe, '-hide_banner', '-v', 'error', '-y', *lavfi, os.path.join(folder, name)], check=True)
+        return os.path.dirname(ffmpegexe)
+    if sys.platform == 'win32':
+        raise SystemExit('ffmpeg is required on Windows, the stub ffprobe is a script.')
+    for name in CLIPS:
+        open(os.path.join(folder, name), 'wb').close()
+    stub = os.path.join(folder, 'ffprobe')
+    with open(stub, 'w') as f:
+        f.write(STUB_FFPROBE.format(python=sys.executable))
+    os.chmod(stub, 0o755)
+    return folder
+
+def links(folder: str, name: str, count: int) -> list[str]:
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, 'encode', f'{i:03d}_{name}')
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(os.path.join(folder, name), path)
+        paths.append(path)
+    return paths
+
+def sources(folder: str, count: int) -> list[str]:
+    # hard links give every source its own path without copying media
+    names = [x for x in CLIPS if not x.endswith('.png')]
+    paths = []
+    for i in range(count):
+        name = names[i % len(names)]
+        path = os.path.join(folder, 'sources', f'{i:05d}_{name}')
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(os.path.join(folder, name), path)
+        paths.append(path)
+    return paths
+
+def frames(folder: str, count: int) -> str:
+    path = os.path.join(folder, f'frames_{count}')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        for i in range(1, count + 1):
+            os.link(os.path.join(folder, 'frame.png'), os.path.join(path, f'shot_{i:05d}.png'))
+    return path
+
+def reset(cache: bool = False):
+    with MediaFiles.Lock:
+        MediaFiles.Collection.clear()
+        MediaFiles.ByFilepath.clear()
+        MediaFiles.ById.clear()
+        MediaFiles.NextId = 1
+        MediaFiles.Pending.clear()
+    EncodeJobs.Collection.clear()
+    if cache:
+        if ProbeCache.Connection is not None:
+            ProbeCache.Connection.close()
+            ProbeCache.Connection = None
+        for suffix in ('', '-wal', '-shm'):
+            path = os.path.join(FEncCore.user_dir(), ProbeCache.Filename + suffix)
+            if os.path.exists(path): os.remove(path)
+
+def ingest(paths: list[str]):
+    for media in MediaFiles.ProbePool.map(MediaFiles, paths):
+        if media is not None: media.Register()
+
+def fill(count: int):
+    # sources beyond --probe-max are copies of probed ones, only their paths differ
+    templates = list(MediaFiles.Collection)
+    for i in range(MediaFiles.Count(), count):
+        media = object.__new__(MediaFiles) # __new__ would reject the template path as a duplicate
+        media.__dict__.update(templates[i % len(templates)].__dict__)
+        media.id = None
+        media.filepath = media.origpath = f'{media.filepath}.copy{i}'
+        media.log = FEncCore.MediaLog(media.basename)
+        media.Register()
+
+def timed(results: list, name: str, count: int, fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+    results.append({'name': name, 'sources': count, 'seconds': round(seconds, 6), 'per_source_us': round(seconds / max(count, 1) * 1e6, 3)})
+    print(f'{name:>16} {count:>6} {seconds:10.4f} s', file=sys.stderr)
+
+def run(sizes: list[int], probe_max: int, folder: str) -> list[dict]:
+    results = []
+    vpreset = VideoPresets.GetPresetByName('libx h264 420p cbr 8M slow')
+    apreset = AudioPresets.ByName('aac')
+    logged = []
+    Events.Subscribe(Event.LOG, lambda **record: logged.append(record))
+    for size in sizes:
+        probed = sources(folder, min(size, probe_max))
+        timed(results, 'sequence_scan', size, ImageSequences.Scan, [frames(folder, size)])
+        reset(cache=True)
+        timed(results, 'probe', len(probed), ingest, probed)
+        reset()
+        timed(results, 'probe_cached', len(probed), ingest, probed)
+        fill(size)
+        media = list(MediaFiles.Collection)
+        timed(results, 'detect_type', size, lambda: [x.detect_type() for x in media])
+        timed(results, 'lookup_filepath', size, lambda: [MediaFiles.GetByFilepath(x.filepath) for x in media])
+        timed(results, 'lookup_id', size, lambda: [MediaFiles.GetById(x.id) for x in media])
+        timed(results, 'lookup_index', size, lambda: [MediaFiles.GetIndex(x) for x in media])
+        timed(results, 'lookup_position', size, lambda: [MediaFiles.GetByIndex(i) for i in range(size)])
+        for x in media:
+            x.video_preset, x.audio_preset = vpreset, apreset
+        timed(results, 'argv_compile', size, lambda: [PresetCommands.compile(vpreset) for x in media])
+        timed(results, 'argv_build', size, lambda: [EncodeJobs(x) for x in media])
+        logged.clear()
+        timed(results, 'log', size, lambda: [log(x, text='Benchmark', file=x.filename, end='line.') for x in media])
+        reset()
+    return results
+
+def encode_cell(cell: dict) -> dict:
+    # runs in its own process, so the rusage of the children covers this cell only
+    FEncCore.ffmpeg = FFmpeg(cell['ffmpeg'])
+    FEncCore.load_defaults()
+    if cell['kind'] == 'video':
+        vpreset, apreset, clip = VideoPresets.GetPresetByName(cell['preset']), AudioPresets.ByName('No audio'), 'clip.mp4'
+    else:
+        vpreset, apreset, clip = None, AudioPresets.ByName(cell['preset']), 'tone.wav'
+    MediaFiles.ProbePool = FEncCore.ThreadPoolExecutor(max_workers=MediaFiles.ProbeWorkers, thread_name_prefix='probe')
+    ingest(links(cell['media'], clip, cell['jobs']))
+    jobs = []
+    for media in MediaFiles.Collection:
+        media.video_preset, media.audio_preset = vpreset, apreset
+        media.out_dir = cell['out']
+        jobs.append(EncodeJobs.Add(media))
+    EncodeJobs.Workers = cell['workers']
+    # the benchmark's own load must not hold jobs back, the matrix would time the admission waits
+    EncodeJobs.MaxLoad = 0
+    EncodeJobs.MinFreeMemory = 0
+    before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource is not None else None
+    start = time.perf_counter()
+    EncodeJobs.Start(jobs)
+    FEncCore.wait([job.future for job in jobs])
+    wall = time.perf_counter() - start
+    done = [job for job in jobs if job.state == JobState.DONE]
+    frames = sum(job.frames or 0 for job in done)
+    seconds = sum(job.duration or 0 for job in done)
+    sizes = [os.path.getsize(job.output) for job in done if os.path.isfile(job.output)]
+    result = {
+        'preset': cell['preset'],
+        'kind': cell['kind'],
+        'workers': cell['workers'],
+        'jobs': len(jobs),
+        'failed': len(jobs) - len(done),
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': None,
+        'peak_rss_mb': None,
+        'fps': round(frames / wall, 2) if frames else None,
+        'realtime': round(seconds / wall, 2) if seconds else None,
+        'bitrate_kbps': round(sum(sizes) * 8 / seconds / 1000, 1) if seconds and sizes else None,
+        'error': next((job.errors.splitlines()[-1] for job in jobs if job.state != JobState.DONE and job.errors), None),
+    }
+    if before is not None:
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result['cpu_seconds'] = round(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime, 3)
+        # kilobytes on Linux, bytes on macOS, the largest single ffmpeg process either way
+        result['peak_rss_mb'] = round(after.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return result
+
+def run_encode(folder: str, ffmpeg_path: str, workers: list[int], count: int) -> list[dict]:
+    # every non-system preset at every pool size, the same number of clips each time
+    for name in ('clip.mp4', 'tone.wav'):
+        links(folder, name, count)
+    cells = [(x.name, 'video') for x in VideoPresets.Collection if not x.system] + [(x.name, 'audio') for x in AudioPresets.Collection if not x.system]
+    results = []
+    for preset, kind in cells:
+        for size in workers:
+            cell = {'preset': preset, 'kind': kind, 'workers': size, 'jobs': count, 'media': folder, 'ffmpeg': ffmpeg_path, 'out': os.path.join(folder, 'out', f'{kind}_{len(results)}')}
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--encode-cell', json.dumps(cell)], capture_output=True, encoding='utf-8', errors='replace')
+            if child.returncode != 0:
+                result = {'preset': preset, 'kind': kind, 'workers': size, 'jobs': count, 'failed': count, 'error': child.stderr.strip().splitlines()[-1:]}
+            else:
+                result = json.loads(child.stdout)
+            shutil.rmtree(cell['out'], ignore_errors=True)
+            # throughput per core, relative to one worker it shows where adding workers stops paying off
+            rate = result.get('fps') or result.get('realtime')
+            if rate and result.get('cpu_seconds'):
+                result['per_cpu_second'] = round(rate * result['wall_seconds'] / result['cpu_seconds'], 2)
+            first = next((x for x in results if x['preset'] == preset and (x.get('fps') or x.get('realtime'))), None)
+            if rate and first is not None:
+                result['speedup'] = round(rate / (first.get('fps') or first.get('realtime')), 2)
+            results.append(result)
+            print(f'{preset:>32} {size:>3} workers {result.get("wall_seconds", "-"):>8} s {rate or "-":>8} {"fps" if kind == "video" else "x realtime"}', file=sys.stderr)
+    return results
+
+def compare(results: list[dict], baseline: str, tolerance: float) -> int:
+    # a result slower than the baseline by more than the tolerance is a regression
+    key = lambda x: (x.get('name', x.get('preset')), x.get('sources', x.get('workers')))
+    seconds = lambda x: x.get('seconds', x.get('wall_seconds')) or 0
+    with open(baseline) as f:
+        previous = {key(x): x for x in json.load(f)['results']}
+    regressions = 0
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or seconds(old) <= 0 or seconds(result) <= 0:
+            continue
+        ratio = seconds(result) / seconds(old)
+        if ratio > 1 + tolerance:
+            regressions += 1
+            print(f'Regression: {key(result)[0]} at {key(result)[1]} is {ratio:.2f}x slower ({seconds(old)} -> {seconds(result)} s)', file=sys.stderr)
+    return regressions
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='FEncBench.py', description=f'{VERSION} benchmarks, results go to stdout as JSON.')
+    parser.add_argument('--sizes', default='10,1000,10000', help='comma separated numbers of sources')
+    parser.add_argument('--probe-max', type=int, default=1000, help='sources really probed per size, the rest are copies')
+    parser.add_argument('--encode', action='store_true', help='run the encode throughput matrix of the non-system presets instead, needs ffmpeg')
+    parser.add_argument('--workers', default=None, help='comma separated pool sizes for --encode, powers of two up to the cpu count by default')
+    parser.add_argument('--jobs', type=int, default=None, help='clips encoded per pool size, the largest pool size by default')
+    parser.add_argument('--ffmpeg', default=None, help='folder with the ffmpeg and ffprobe executables')
+    parser.add_argument('--encode-cell', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--stub', action='store_true', help='use the stub ffprobe even when ffmpeg is installed')
+    parser.add_argument('--out', default=None, help='write the JSON here instead of stdout')
+    parser.add_argument('--compare', default=None, help='previous JSON result, exits with 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against --compare')
+    return parser
+
+def main(argv: list) -> int:
+    args = arg_parser().parse_args(argv)
+    if args.encode_cell is not None:
+        print(json.dumps(encode_cell(json.loads(args.encode_cell))))
+        return 0
+    if args.encode:
+        args.stub = False
+        if args.workers is None:
+            args.workers = ','.join(str(2 ** i) for i in range((os.cpu_count() or 1).bit_length()))
+        workers = [int(x) for x in args.workers.split(',')]
+    with tempfile.TemporaryDirectory(prefix='ffenc_bench_') as folder:
+        # the probe cache and settings stay inside the temporary folder
+        os.environ['XDG_CONFIG_HOME'] = os.environ['LOCALAPPDATA'] = os.path.join(folder, 'config')
+        ffmpeg_path = make_media(os.path.join(folder, 'media'), not args.stub, args.ffmpeg)
+        if args.encode and ffmpeg_path == os.path.join(folder, 'media'):
+            raise SystemExit('ffmpeg not found, encode benchmarks need it, use --ffmpeg.')
+        FEncCore.ffmpeg = FFmpeg(ffmpeg_path)
+        FEncCore.load_defaults()
+        if args.encode:
+            results = run_encode(os.path.join(folder, 'media'), ffmpeg_path, workers, args.jobs or max(workers))
+        else:
+            MediaFiles.ProbePool = FEncCore.ThreadPoolExecutor(max_workers=MediaFiles.ProbeWorkers, thread_name_prefix='probe')
+            results = run([int(x) for x in args.sizes.split(',')], args.probe_max, os.path.join(folder, 'media'))
+            MediaFiles.ProbePool.shutdown()
+        report = {
+            'version': VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'ffprobe': 'stub' if ffmpeg_path == os.path.join(folder, 'media') else FEncCore.ffmpeg.ffprobeexe,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'mode': 'encode' if args.encode else 'hot paths',
+            'results': results,
+        }
+    text = json.dumps(report, indent=1)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare is not None and compare(results, args.compare, args.tolerance) > 0:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,2740 @@
+import sys, os, subprocess, re, json, argparse, hashlib, sqlite3, threading, time, shutil, bisect, select
+import ctypes, ctypes.util
+from collections import deque
+from collections.abc import Mapping
+from types import MappingProxyType
+from contextlib import contextmanager
+import datetime as dt
+from typing import Self
+from enum import Enum
+from pathlib import Path, PurePath
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+try:
+    import psutil # optional, load and free memory where /proc and os.getloadavg are missing
+except ImportError:
+    psutil = None
+
+# FFEnc model and encoding core, it never imports wx so it also runs headless
+
+VERSION = 'FFEnc v0.096a'
+
+class MediaType(Enum):
+    NONE  =    -1, 'Not media'
+    VIDEO =    0,  'Video'
+    IMAGE =    1,  'Image(s)'
+    SEQUENCE = 2,  'Sequence'
+    AUDIO =    3,  'Audio'
+    DATA =     4,  'Data'
+
+    def __init__(self, id: int, doc: str):
+        self.id = id
+        self.doc = doc
+
+class Encoders():
+
+    Collection = []
+    ClassName = 'Encoder'
+    Schemas: dict[str, Mapping] = {} # frozen option schemas by their json, equal ones are one object for all encoders
+    video_filters = {
+        'Scale filter': True,
+        'Scale': {
+            'ffoption': '-vf', 
+            'values':   ['-1', '320', '480', '720', '1080', '2160'],
+            'current':  '-1',
+            'doc':      'Scale video',
+            'fixed':    False,
+        },
+        'Scale algo': {
+            'ffoption': '-vf', 
+            'values':   ['bilinear', 'bicubic', 'bicublin', 'gauss', 'sinc', 'lanczos',],
+            'current':  'bicubic',
+            'doc':      'Scaling algorythm',
+            'fixed':    False,
+        },
+    }
+    audio_filters = {
+        'Volume filter': True,
+        'Volume': {
+            'name':     'Volume',
+            'ffoption': '-af', 
+            'values':   ['25', '50', '75', '100', '125', '150'],
+            'current':  '100',
+            'doc':      'Change audio volume',
+            'fixed':    False,
+        }
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.index = Encoders.Count()
+        self.name: str = kwargs.get('name')
+        self.type: str = kwargs.get('type')
+        self.system: bool = kwargs.get('system')
+        self.general: list = kwargs.get('general')
+        self.threading: list = kwargs.get('threading')
+        self.formats: list = kwargs.get('formats')
+        self.audio_codecs: list = kwargs.get('audio_codecs')
+        self.colorcodings: dict = kwargs.get('colorcodings')
+        # the filters are merged into a new dict, neither the definition nor the class filters are touched
+        options = {**kwargs.get('options'), **(self.video_filters if self.type == MediaType.VIDEO else self.audio_filters if self.type == MediaType.AUDIO else {})}
+        self.schema_key = hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+        self.options: Mapping = self.freeze(options)
+
+    @classmethod
+    def freeze(cls, value):
+        # read-only copies, dicts become mapping proxies and lists tuples
+        if isinstance(value, dict):
+            key = json.dumps(value, sort_keys=True)
+            frozen = cls.Schemas.get(key)
+            if frozen is None:
+                frozen = cls.Schemas[key] = MappingProxyType({k: cls.freeze(v) for k, v in value.items()})
+            return frozen
+        if isinstance(value, list):
+            return tuple(cls.freeze(x) for x in value)
+        return value
+
+    def Default(self, key: str | tuple) -> str | None:
+        # the schema value of an option name or of an (option, value, suboption) path, None if the encoder has no such option
+        if isinstance(key, str):
+            option = self.options.get(key)
+            return option['current'] if isinstance(option, Mapping) else None
+        name, value_name, suboption_name = key
+        option = self.options.get(name)
+        if not isinstance(option, Mapping) or not isinstance(option['values'][0], Mapping):
+            return None
+        for value in option['values']:
+            if value['name'] == value_name:
+                for suboption in value.get('suboptions', ()):
+                    if suboption['name'] == suboption_name:
+                        return suboption['current']
+        return None
+
+    def Options(self, values: dict) -> Mapping:
+        # the schema with a preset's values in place, only the changed paths are new objects
+        if len(values) == 0:
+            return self.options
+        options = dict(self.options)
+        for key, current in values.items():
+            if self.Default(key) is None:
+                continue # an option of another encoder
+            if isinstance(key, str):
+                options[key] = MappingProxyType({**options[key], 'current': current})
+                continue
+            name, value_name, suboption_name = key
+            option_values = list(options[name]['values'])
+            for i, value in enumerate(option_values):
+                if value['name'] == value_name:
+                    suboptions = tuple(MappingProxyType({**x, 'current': current}) if x['name'] == suboption_name else x for x in value['suboptions'])
+                    option_values[i] = MappingProxyType({**value, 'suboptions': suboptions})
+            options[name] = MappingProxyType({**options[name], 'values': tuple(option_values)})
+        return MappingProxyType(options)
+
+    @classmethod
+    def Add(cls, *args, **kwargs):
+        cls.Collection.append(cls(*args, **kwargs))
+
+    @classmethod
+    def ByIndex(cls, index: int):
+        return cls.Collection[index]
+
+    @classmethod
+    def ByName(cls, name: str):
+        for preset in cls.Collection:
+            if preset.name == name:
+                return preset
+        return None
+
+    @classmethod
+    def Count(cls) -> int:
+        return len(cls.Collection)
+    
+    @classmethod
+    def Names(cls, type: MediaType) -> list:
+        return [enc.name for enc in cls.Collection if enc.type == type and enc.system == False]
+
+class Presets():
+
+    # a preset is its encoder's frozen schema plus the values it changed, the merged options are built when needed
+    Collection = []
+
+    def __init__(self, name: str, encoder: Encoders, default_format: str, system: bool = False):
+        self.name = name
+        self.index = type(self).Count()
+        self.system = system
+        self.encoder = encoder
+        self.default_format = default_format
+        self.origin: str = None # built-in name, saved presets refer to the built-in they changed
+        self.values: dict[str | tuple, str] = {} # option name or (option, value, suboption) path to its current value
+        self._options: Mapping = None
+        self.argv_key: str = None
+
+    @property
+    def encoder_options(self) -> Mapping:
+        if self._options is None:
+            self._options = self.encoder.Options(self.values)
+        return self._options
+
+    @classmethod
+    def Count(cls) -> int:
+        return len(cls.Collection)
+
+    @classmethod
+    def Delete(cls, preset: Self):
+        index = cls.Collection.index(preset)
+        cls.Collection.pop(index)
+        for i, other in enumerate(cls.Collection):
+            other.index = i
+        # sources fall back to no preset rather than encoding with a deleted one
+        for media in MediaFiles.Collection:
+            if media.video_preset is preset: media.video_preset = None
+            if media.audio_preset is preset: media.audio_preset = None
+            media.outputs = [pair for pair in media.outputs if preset not in pair]
+        Events.Emit(Event.PRESET_DELETED, preset=preset, index=index)
+
+    def Duplicate(self) -> Self:
+        names = [preset.name for preset in type(self).Collection]
+        name = f'{self.name} copy'
+        copies = 1
+        while name in names:
+            copies += 1
+            name = f'{self.name} copy {copies}'
+        preset = type(self).Add(name, self.encoder, self.default_format)
+        preset.values = dict(self.values)
+        return preset
+
+    def SetOption(self, name: str, value: str):
+        self.values[name] = value
+        self.changed()
+
+    def SetSuboption(self, name: str, value_name: str, suboption_name: str, value: str):
+        self.values[(name, value_name, suboption_name)] = value
+        self.changed()
+
+    def SetEncoder(self, encoder: Encoders):
+        # a new encoder starts from its own defaults
+        self.encoder = encoder
+        self.values = {}
+        self.changed()
+
+    def changed(self):
+        self._options = None
+        PresetCommands.Invalidate(self)
+
+    def GetValueIndex(self, options_list: list, suboption_name: str) -> int:
+        for i, suboption in enumerate(options_list):
+            if suboption['name'] == suboption_name:
+                return i
+
+    def Overrides(self) -> dict:
+        # the values that differ from the schema, values of options the encoder does not have are dropped
+        overrides = {'options': {}, 'suboptions': {}}
+        for key, current in self.values.items():
+            default = self.encoder.Default(key)
+            if default is None or default == current:
+                continue
+            if isinstance(key, str):
+                overrides['options'][key] = current
+            else:
+                name, value_name, suboption_name = key
+                overrides['suboptions'].setdefault(name, {}).setdefault(value_name, {})[suboption_name] = current
+        return overrides
+
+    @staticmethod
+    def Values(overrides: dict) -> dict:
+        values = dict(overrides.get('options', {}))
+        for name, option_values in overrides.get('suboptions', {}).items():
+            for value_name, suboptions in option_values.items():
+                for suboption_name, current in suboptions.items():
+                    values[(name, value_name, suboption_name)] = current
+        return values
+
+    def Record(self) -> dict:
+        return {'name': self.name, 'builtin': self.origin, 'encoder': self.encoder.name, 'format': self.default_format, **self.Overrides()}
+
+class VideoPresets(Presets):
+
+    Collection = []
+    ClassName = 'Video preset'
+
+    def __init__(self, name: str, encoder: Encoders, default_format: str, system: bool = False):
+        if encoder.type == MediaType.VIDEO:
+            super().__init__(name, encoder, default_format, system)
+            Events.Emit(Event.PRESET_ADDED, preset=self)
+        else:
+            raise Exception('You are trying to assing a non-video Encoder to a video preset.')
+
+    @classmethod
+    def Add(cls, name: str, encoder: Encoders, default_format: str, system: bool = False) -> Self:
+        preset = cls(name, encoder, default_format, system)
+        cls.Collection.append(preset)
+        return preset
+
+    @classmethod
+    def GetPresetByName(cls, name: str) -> Self:
+        for preset in cls.Collection:
+            if preset.name == name:
+                return preset
+        return None
+            
+    @classmethod
+    def GetPresetByIndex(cls, index: int) -> Self:
+        return cls.Collection[index]
+    
+    @classmethod
+    def NameList(cls) -> list:
+        return [preset.name for preset in cls.Collection]
+
+    def SetVideoEncoder(self, encoder: Encoders) -> Self:
+        self.SetEncoder(encoder)
+        self.system = encoder.system
+        self.editable = True
+        self.default_format = encoder.formats[0]
+        return self
+
+class AudioPresets(Presets):
+
+    Collection = []
+    ClassName = 'Audio preset'
+
+    def __init__(self, name: str, encoder: Encoders, default_format: str, system: bool = False, editable: bool = True):
+        if encoder.type == MediaType.AUDIO:
+            super().__init__(name, encoder, default_format, system)
+            self.editable = editable
+            Events.Emit(Event.PRESET_ADDED, preset=self)
+        else:
+            raise Exception('You are trying to assing a non-audio Encoder to a video preset.')
+
+    @classmethod
+    def Add(cls, name: str, encoder: Encoders, default_format: str, system: bool = False, editable: bool = True) -> Self:
+        preset = cls(name, encoder, default_format, system, editable)
+        cls.Collection.append(preset)
+        return preset
+
+    @classmethod
+    def ByName(cls, name: str) -> Self:
+        for preset in cls.Collection:
+            if preset.name == name:
+                return preset
+        return None
+            
+    @classmethod
+    def ByIndex(cls, index: int) -> Self:
+        return cls.Collection[index]
+    
+    @classmethod
+    def Names(cls) -> list:
+        return [preset.name for preset in cls.Collection]
+    
+    def SetAudioEncoder(self, encoder: Encoders) -> Self:
+        self.SetEncoder(encoder)
+        self.system = encoder.system
+        self.editable = True
+        self.default_format = encoder.formats[0]
+        return self
+
+class PresetCommands():
+
+    # compiled preset arguments by the encoder schema and the preset values, schemas are frozen so the key is safe to share
+    Cache: dict[str, list] = {}
+    CacheSize = 256
+
+    @classmethod
+    def Get(cls, preset: VideoPresets | AudioPresets) -> list:
+        if preset.argv_key is None:
+            preset.argv_key = cls.state_hash(preset)
+        argv = cls.Cache.get(preset.argv_key)
+        if argv is None:
+            if len(cls.Cache) >= cls.CacheSize:
+                cls.Cache.clear()
+            argv = cls.Cache[preset.argv_key] = cls.compile(preset)
+        return argv
+
+    @classmethod
+    def Invalidate(cls, preset: VideoPresets | AudioPresets):
+        # options are copied on write, a change never reaches another preset
+        preset.argv_key = None
+
+    @staticmethod
+    def state_hash(preset: VideoPresets | AudioPresets) -> str:
+        state = json.dumps([preset.encoder.name, preset.encoder.schema_key, preset.default_format, sorted(preset.values.items(), key=str)])
+        return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def compile(cls, preset: VideoPresets | AudioPresets) -> list:
+        stream = 'v' if preset.encoder.type == MediaType.VIDEO else 'a'
+        options = preset.encoder_options
+        if preset.encoder.system:
+            ffoption = options.get('ffoption')
+            return ffoption.split() if ffoption is not None else [f'-{stream}n']
+        argv = [f'-c:{stream}', preset.encoder.name]
+        for optionkey, optionval in options.items():
+            if not isinstance(optionval, Mapping) or optionkey in Encoders.video_filters or optionkey in Encoders.audio_filters:
+                continue
+            argv += cls.option_args(optionval)
+        argv += cls.filter_args(preset)
+        return argv
+
+    @staticmethod
+    def option_args(option: dict) -> list:
+        current = option['current']
+        if isinstance(option['values'][0], Mapping):
+            # options with suboptions, the selected value carries its own ffoption
+            value = next((x for x in option['values'] if x['name'] == current), None)
+            if value is None or value.get('ffoption') is None:
+                return []
+            args = value['ffoption'].split()
+            for suboption in value.get('suboptions', ()):
+                if suboption['current'] == '-1':
+                    continue
+                if suboption.get('ffoption') is not None:
+                    args += [suboption['ffoption'], suboption['current']]
+                elif len(args) == 1:
+                    # a bare mode flag takes the value of its first suboption, i.e. -crf 20
+                    args.append(suboption['current'])
+            # a bare mode flag without a value leaves the encoder default
+            return args if len(args) > 1 else []
+        if option.get('ffoption') is None or current == '-1':
+            return []
+        return [option['ffoption'], current]
+
+    @staticmethod
+    def filter_args(preset: VideoPresets | AudioPresets) -> list:
+        options = preset.encoder_options
+        if preset.encoder.type == MediaType.VIDEO:
+            if options.get('Scale filter') and options['Scale']['current'] != '-1':
+                return [options['Scale']['ffoption'], f"scale=-2:{options['Scale']['current']}:flags={options['Scale algo']['current']}"]
+        elif options.get('Volume filter') and options['Volume']['current'] != '100':
+            return [options['Volume']['ffoption'], f"volume={float(options['Volume']['current'])/100}"]
+        return []
+
+class UserPresets():
+
+    # presets saved from the GUI, stored as their differences from the encoder defaults
+    Filename = 'presets.json'
+    Path: str = None
+    Deleted: dict[str, list] = {'video': [], 'audio': []} # built-in presets the user deleted
+    Kinds = {'video': VideoPresets, 'audio': AudioPresets}
+
+    @classmethod
+    def Load(cls, path: str = None) -> int:
+        # runs after the built-ins are added, the options of a saved preset are only built when it is first used
+        cls.Path = path or os.path.join(user_dir(), cls.Filename)
+        for presets in cls.Kinds.values():
+            for preset in presets.Collection:
+                preset.origin = preset.name
+        try:
+            with open(cls.Path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            log(error=f'Presets not loaded ({e})', file=cls.Path)
+            return 0
+        loaded = 0
+        for kind, presets in cls.Kinds.items():
+            cls.Deleted[kind] = saved.get('deleted', {}).get(kind, [])
+            for name in cls.Deleted[kind]:
+                builtin = next((x for x in presets.Collection if x.origin == name), None)
+                if builtin is not None: presets.Delete(builtin)
+            for record in saved.get(kind, []):
+                encoder = Encoders.ByName(record.get('encoder'))
+                if encoder is None or encoder.type != (MediaType.VIDEO if kind == 'video' else MediaType.AUDIO) or encoder.system:
+                    log(error='Preset skipped, unknown encoder', file=record.get('name'), end=record.get('encoder'))
+                    continue
+                preset = next((x for x in presets.Collection if x.origin is not None and x.origin == record.get('builtin')), None)
+                if preset is None:
+                    preset = presets.Add(record['name'], encoder, record.get('format', encoder.formats[0]))
+                else:
+                    preset.name = record['name']
+                    preset.SetEncoder(encoder)
+                    preset.default_format = record.get('format', preset.default_format)
+                preset.values = Presets.Values(record)
+                loaded += 1
+        return loaded
+
+    @classmethod
+    def Save(cls):
+        if cls.Path is None:
+            cls.Path = os.path.join(user_dir(), cls.Filename)
+        os.makedirs(os.path.dirname(cls.Path) or '.', exist_ok=True)
+        saved = {'version': VERSION, 'deleted': cls.Deleted}
+        for kind, presets in cls.Kinds.items():
+            saved[kind] = [preset.Record() for preset in presets.Collection if not preset.system]
+        with open(cls.Path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(saved, f, indent=1)
+        os.replace(cls.Path + '.tmp', cls.Path)
+
+    @classmethod
+    def Delete(cls, preset: Presets):
+        # a deleted built-in has to stay deleted on the next start
+        if preset.origin is not None:
+            cls.Deleted['video' if isinstance(preset, VideoPresets) else 'audio'].append(preset.origin)
+        type(preset).Delete(preset)
+        cls.Save()
+
+class ProbeCache():
+
+    # parsed probes by absolute path, size and mtime so re-added files skip ffprobe
+    Enabled = True
+    MaxEntries = 100000
+    Filename = 'probe_cache.sqlite'
+    Version = 2 # of the table layout
+    Connection: sqlite3.Connection = None
+    Lock = threading.Lock()
+    Writes = 0
+    Used: dict[str, float] = {} # recency of cache hits, written with the next put or once enough piled up
+    UsedBatch = 256
+
+    @classmethod
+    def open(cls) -> bool:
+        if cls.Connection is None and cls.Enabled:
+            try:
+                os.makedirs(user_dir(), exist_ok=True)
+                cls.Connection = sqlite3.connect(os.path.join(user_dir(), cls.Filename), check_same_thread=False)
+                cls.Connection.execute('PRAGMA journal_mode=WAL')
+                cls.Connection.execute('PRAGMA synchronous=NORMAL')
+                if cls.Connection.execute('PRAGMA user_version').fetchone()[0] != cls.Version:
+                    cls.Connection.execute('DROP TABLE IF EXISTS probes') # a cache, older layouts are simply rebuilt
+                    cls.Connection.execute(f'PRAGMA user_version={cls.Version}')
+                cls.Connection.execute('CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, used REAL, data TEXT)')
+                cls.Connection.execute('CREATE INDEX IF NOT EXISTS probes_used ON probes (used)')
+                cls.Connection.commit()
+            except (sqlite3.Error, OSError) as e:
+                cls.disable(e)
+        return cls.Connection is not None
+
+    @classmethod
+    def disable(cls, e: Exception):
+        # a locked or corrupt cache only costs the probes, called with Lock held
+        log(error=f'Probe cache disabled ({e})', file=os.path.join(user_dir(), cls.Filename))
+        cls.Enabled = False
+        cls.Used = {}
+        if cls.Connection is not None:
+            try:
+                cls.Connection.close()
+            except sqlite3.Error:
+                pass
+            cls.Connection = None
+
+    @staticmethod
+    def key(filepath: str, statpath: str) -> tuple | None:
+        try:
+            st = os.stat(statpath)
+        except OSError:
+            return None
+        return os.path.abspath(filepath), st.st_size, st.st_mtime_ns
+
+    @classmethod
+    def Get(cls, filepath: str, statpath: str) -> dict | None:
+        key = cls.key(filepath, statpath)
+        if key is None:
+            return None
+        with cls.Lock:
+            if not cls.open():
+                return None
+            try:
+                row = cls.Connection.execute('SELECT data FROM probes WHERE path=? AND size=? AND mtime=?', key).fetchone()
+                if row is None:
+                    return None
+                # a read must not cost a transaction, hits only update the recency in batches
+                cls.Used[key[0]] = time.time()
+                if len(cls.Used) >= cls.UsedBatch:
+                    cls.write_used()
+                    cls.Connection.commit()
+            except sqlite3.Error as e:
+                cls.disable(e)
+                return None
+        return json.loads(row[0])
+
+    @classmethod
+    def Put(cls, filepath: str, statpath: str, data: dict):
+        key = cls.key(filepath, statpath)
+        if key is None:
+            return
+        with cls.Lock:
+            if not cls.open():
+                return
+            try:
+                cls.Connection.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)', (*key, time.time(), json.dumps(data)))
+                cls.write_used()
+                cls.Writes += 1
+                if cls.Writes % 256 == 0:
+                    cls.evict()
+                cls.Connection.commit()
+            except sqlite3.Error as e:
+                cls.disable(e)
+
+    @classmethod
+    def Flush(cls):
+        # pending recency of cache hits, at exit
+        with cls.Lock:
+            if cls.Connection is not None and len(cls.Used) > 0:
+                try:
+                    cls.write_used()
+                    cls.Connection.commit()
+                except sqlite3.Error as e:
+                    cls.disable(e)
+
+    @classmethod
+    def write_used(cls):
+        if len(cls.Used) > 0:
+            cls.Connection.executemany('UPDATE probes SET used=? WHERE path=?', list(zip(cls.Used.values(), cls.Used.keys())))
+            cls.Used = {}
+
+    @classmethod
+    def evict(cls):
+        # least recently used entries go first once the cap is reached
+        count = cls.Connection.execute('SELECT COUNT(*) FROM probes').fetchone()[0]
+        if count > cls.MaxEntries:
+            cls.Connection.execute('DELETE FROM probes WHERE rowid IN (SELECT rowid FROM probes ORDER BY used LIMIT ?)', (count - cls.MaxEntries,))
+
+class MediaLog():
+
+    # bounded per-file log, records pushed out of the ring go to a spill file when SpillDir is set
+    Lines = 500
+    SpillDir: str = None
+
+    def __init__(self, name: str):
+        self.name = name
+        self.records: deque[dict] = deque(maxlen=self.Lines)
+        self.spilled = 0
+        self.spill_path: str = None
+        self.lock = threading.Lock()
+
+    def Add(self, record: dict):
+        with self.lock:
+            if len(self.records) == self.records.maxlen:
+                self.spill(self.records[0])
+            self.records.append(record)
+
+    def Records(self) -> list[dict]:
+        with self.lock:
+            return list(self.records)
+
+    def spill(self, record: dict):
+        self.spilled += 1
+        if self.SpillDir is None:
+            return
+        try:
+            if self.spill_path is None:
+                os.makedirs(self.SpillDir, exist_ok=True)
+                self.spill_path = os.path.join(self.SpillDir, f'{self.name}_{os.getpid()}_{id(self):x}.log')
+            with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+                spill_file.write(log_line(record) + '\n')
+        except OSError as e:
+            # not logged to this file, its lock is held here
+            log(error=f'Log spill failed ({e.strerror}), spilling stopped', file=self.spill_path or self.SpillDir)
+            MediaLog.SpillDir = None
+
+class ImageSequences():
+
+    # numbered frames found on disk, i.e. shot_%04d.exr 1001-1240
+    FrameName = re.compile(r'^(.*?)(\d+)(\.[A-Za-z0-9]+)$')
+    Extensions = ['.exr', '.dpx', '.tif', '.tiff', '.png', '.jpg', '.jpeg', '.tga', '.bmp', '.webp', '.dds', '.jp2', '.j2k', '.hdr', '.cin', '.sgi', '.ppm', '.pgm']
+
+    def __init__(self, folder: str, prefix: str, extension: str, padding: int, numbers: list[int]):
+        self.folder = folder
+        self.prefix = prefix
+        self.extension = extension
+        self.padding = padding # 0 for unpadded counters
+        self.numbers = sorted(numbers)
+        self.start = self.numbers[0]
+        self.end = self.numbers[-1]
+        self.count = len(self.numbers)
+        self.gaps: list[tuple[int, int]] = [(a+1, b-1) for a, b in zip(self.numbers, self.numbers[1:]) if b - a > 1]
+        counter = f'%0{padding}d' if padding > 0 else '%d'
+        self.pattern = os.path.join(folder, f'{prefix}{counter}{extension}')
+
+    def FramePath(self, number: int) -> str:
+        return self.pattern.replace('%0' + str(self.padding) + 'd' if self.padding > 0 else '%d', f'{number:0{self.padding}d}', 1)
+
+    def Contiguous(self) -> int:
+        # ffmpeg stops reading at the first missing frame
+        return (self.gaps[0][0] if len(self.gaps) > 0 else self.end + 1) - self.start
+
+    @classmethod
+    def Scan(cls, paths: list[str]) -> tuple[list[Self], list[str]]:
+        # one os.scandir pass per folder, dropped folders are walked, a lone dropped frame pulls in its siblings
+        frames: dict[tuple[str, str, str], list[str]] = {} # (folder, prefix, extension): counters
+        files: list[str] = []
+        scanned: dict[str, dict] = {}
+        for path in paths:
+            if os.path.isdir(path):
+                cls.scan_folder(path, frames, files, scanned, recursive=True)
+            elif not cls.add_frame(frames, os.path.dirname(path), os.path.basename(path)):
+                files.append(path)
+        for key, counters in list(frames.items()):
+            if len(counters) == 1 and key[0] not in scanned:
+                siblings: dict = {}
+                cls.scan_folder(key[0], siblings, [], scanned)
+                frames[key] = siblings.get(key, counters)
+        sequences = []
+        for (folder, prefix, extension), counters in frames.items():
+            for padding, numbers in cls.by_padding(counters).items():
+                if len(numbers) > 1:
+                    sequences.append(cls(folder, prefix, extension, padding, numbers))
+                else:
+                    files.append(os.path.join(folder, f'{prefix}{numbers[0]:0{padding}d}{extension}'))
+        return sequences, files
+
+    @classmethod
+    def scan_folder(cls, folder: str, frames: dict, files: list, scanned: dict, recursive: bool = False):
+        scanned[folder] = frames
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                # our own outputs and segment parts are never sources
+                if recursive and entry.name != MediaFiles.OutFolder and not entry.name.endswith('.parts'):
+                    cls.scan_folder(entry.path, frames, files, scanned, recursive)
+            elif entry.name.endswith(EncodeJobs.ManifestSuffix):
+                continue
+            elif not cls.add_frame(frames, folder, entry.name):
+                files.append(entry.path)
+
+    @classmethod
+    def add_frame(cls, frames: dict, folder: str, name: str) -> bool:
+        match = cls.FrameName.match(name)
+        if match is None or match.group(3).lower() not in cls.Extensions:
+            return False
+        frames.setdefault((folder, match.group(1), match.group(3)), []).append(match.group(2))
+        return True
+
+    @staticmethod
+    def by_padding(counters: list[str]) -> dict[int, list[int]]:
+        # zero led counters fix the padding, shorter ones belong to an unpadded sequence
+        padded = [x for x in counters if len(x) > 1 and x[0] == '0']
+        if len(padded) > 0:
+            padding = min(len(x) for x in padded)
+        else:
+            widths = {len(x) for x in counters}
+            padding = widths.pop() if len(widths) == 1 else 0
+        groups: dict[int, set[int]] = {}
+        for counter in counters:
+            groups.setdefault(padding if len(counter) >= padding else 0, set()).add(int(counter))
+        return {padding: list(numbers) for padding, numbers in groups.items()}
+
+class MediaFiles():
+
+    # Collection keeps the list order and is always sorted by id, the dicts index it
+    Collection: list[Self] = []
+    ByFilepath: dict[str, Self] = {}
+    ById: dict[int, Self] = {}
+    NextId = 1 # starting at 1 to correspond to the list, never reused after a delete
+    ProbeWorkers: int = min(32, (os.cpu_count() or 1) * 4)
+    ProbePool: ThreadPoolExecutor = None
+    Pending: set[str] = set()
+    Lock = threading.Lock()
+    KeyframeWindow = 20 # seconds read after each cut target to find the next keyframe
+    HashBytes = 4 * 2**20 # read from the head and the tail of a source for a content fingerprint
+    OutFolder = 'encoded' # created next to each source, skipped when walking dropped folders
+
+    def __init__(self, filepath: str, sequence: ImageSequences = None):
+        # only probing happens here, it is safe to construct media in a worker thread
+        # sequences come from ImageSequences.Scan, filepath is their first frame then
+        self.id: int = None
+        self.sequence = sequence
+        self.origpath = filepath
+        self.filepath = filepath
+        self.filename = os.path.basename(filepath)
+        self.extension = PurePath(self.filepath).suffix
+        self.basename = PurePath(self.filepath).stem
+        self.out_basename = self.basename
+        self.out_dir = os.path.join(os.path.dirname(filepath), self.OutFolder)
+        self.out_framerate = 30
+        self.input_param: list = []
+        self.probe_error = ''
+        self.log = MediaLog(self.basename)
+        self.video_preset = None
+        self.audio_preset = None
+        self.outputs: list[tuple[VideoPresets, AudioPresets]] = [] # extra preset pairs encoded from the same decode
+        self.probe()
+        with Metrics.Span('detect_type', file=self.filename):
+            self.detect_type()
+
+    def __new__(cls, filepath: str, sequence: ImageSequences = None):
+        # validation happens in the single probe of __init__, a failed probe gives MediaType.NONE
+        result = None
+        if sequence is not None:
+            filepath = sequence.pattern
+        if cls.GetByFilepath(filepath) is None:
+            result = super(MediaFiles, cls).__new__(cls)
+        else:
+            log(text='File', file=filepath, end='is already in the sources. Skipped.')
+        return result
+
+    def Register(self) -> bool:
+        # the GUI calls this on the main thread only
+        if self.type == MediaType.NONE:
+            log(text='FFmpeg did not recognize', file=self.filename, end=f'as media file. {self.probe_error}')
+            return False
+        with MediaFiles.Lock:
+            if MediaFiles.GetByFilepath(self.filepath) is not None:
+                log(text='File', file=self.filepath, end='is already in the sources. Skipped.')
+                return False
+            self.id = MediaFiles.NextId
+            MediaFiles.NextId += 1
+            MediaFiles.Collection.append(self)
+            MediaFiles.ByFilepath[self.filepath] = self
+            MediaFiles.ById[self.id] = self
+        Events.Emit(Event.MEDIA_ADDED, media=self)
+        if self.sequence is not None:
+            log(self, text='Sequence frames', end=f'{self.sequence.start}-{self.sequence.end}, {self.sequence.count} frames.')
+            if len(self.sequence.gaps) > 0:
+                missing = sum(b - a + 1 for a, b in self.sequence.gaps)
+                log(self, error=f'{missing} frames missing in {len(self.sequence.gaps)} gaps', end=f'starting at {self.sequence.gaps[0][0]}, ffmpeg stops reading there.')
+        return True
+   
+    @classmethod
+    def Add(cls, filepath: str):
+        for filepath, sequence in cls.Sources([filepath]):
+            item = cls(filepath, sequence)
+            if item is not None:
+                item.Register()
+
+    @classmethod
+    def Sources(cls, filepaths: list[str]) -> list[tuple[str, ImageSequences]]:
+        # frames and folders collapse into one source per sequence, probed by its first frame
+        sequences, files = ImageSequences.Scan(filepaths)
+        return [(sequence.FramePath(sequence.start), sequence) for sequence in sequences] + [(filepath, None) for filepath in files]
+
+    @classmethod
+    def AddMany(cls, filepaths: list[str]):
+        # the folder scan and the probes run on the pool, results are registered on the main loop as they finish
+        if cls.ProbePool is None:
+            cls.ProbePool = ThreadPoolExecutor(max_workers=cls.ProbeWorkers, thread_name_prefix='probe')
+        cls.ProbePool.submit(cls.scan, filepaths)
+
+    @classmethod
+    def scan(cls, filepaths: list[str]):
+        # big trees and network shares take a while to walk, so this runs on the pool, never on the main loop
+        try:
+            sources = cls.Sources(filepaths)
+        except Exception as e:
+            log(error=f'Scanning the dropped files failed ({e})')
+            return
+        probes = []
+        with cls.Lock:
+            for filepath, sequence in sources:
+                key = sequence.pattern if sequence is not None else filepath
+                if key not in cls.Pending:
+                    cls.Pending.add(key)
+                    probes.append((key, filepath, sequence))
+        # the total is known before the first probe can finish
+        batch = {'total': len(probes), 'done': 0, 'added': 0}
+        for key, filepath, sequence in probes:
+            future = cls.ProbePool.submit(cls, filepath, sequence)
+            future.add_done_callback(lambda f, filepath=key: Events.Emit(Event.PROBE_DONE, future=f, filepath=filepath, batch=batch))
+
+    @classmethod
+    def probed(cls, future, filepath: str, batch: dict):
+        # PROBE_DONE handler, the GUI bus delivers it on the main loop
+        with cls.Lock:
+            cls.Pending.discard(filepath)
+        batch['done'] += 1
+        try:
+            item = future.result()
+        except Exception as e:
+            log(text='Probing failed for', file=filepath, error=str(e))
+        else:
+            if item is not None and item.Register():
+                batch['added'] += 1
+        if batch['done'] == batch['total']:
+            log(text=f'Added {batch["added"]} of {batch["total"]} files.')
+
+    def probe(self):
+        probe_param = [
+                ffmpeg.ffprobeexe,
+                '-v', 'error',
+                '-hide_banner',
+                '-show_streams',
+                '-show_format',
+                '-sexagesimal',
+                '-of', 'json',
+                self.filepath]
+        cached = ProbeCache.Get(self.filepath, self.origpath)
+        if cached is not None:
+            Metrics.Count('probe_cache_hits')
+            self.streams: list = cached['streams']
+            self.format: dict = cached['format']
+            return None
+        log(text='Probing file', file=self.filename)
+        try:
+            Metrics.Count('subprocess_spawns')
+            with Metrics.Span('probe', file=self.filename):
+                probe = subprocess.run(probe_param, capture_output=True, encoding='utf-8', errors='replace')
+            p = json.loads(probe.stdout) if probe.returncode == 0 else {}
+        except (OSError, ValueError) as e:
+            probe, p = None, {}
+            self.probe_error = str(e)
+        if p.get('format') is None or not p.get('streams'):
+            # the same probe doubles as the media check, nothing usable means not media
+            if probe is not None: self.probe_error = probe.stderr.strip()
+            self.streams = []
+            self.format = None
+            return None
+        else:
+            self.streams: list = p.get('streams')
+            # move/rename tags to the main level for easiers search
+            for i, stream in enumerate(self.streams):
+                if stream.get('tags', None) is not None:
+                    for itemkey, itemval in stream['tags'].items():
+                        self.streams[i]['TAG:'+itemkey.upper()] = itemval
+                    del stream['tags']
+            self.format: dict = p.get('format')
+            if self.format.get('tags', None) is not None:
+                for itemkey, itemval in self.format['tags'].items():
+                    self.format['TAG:'+itemkey.upper()] = itemval
+                del self.format['tags']
+            ProbeCache.Put(self.filepath, self.origpath, {'streams': self.streams, 'format': self.format})
+
+    def detect_type(self):
+        # type detection from the probe
+        if self.format is None:
+            self.type = MediaType.NONE
+            return
+        fn = self.format.get('format_name')
+        if self.sequence is not None:
+            # the probe of the first frame stands for the whole sequence
+            self.type = MediaType.SEQUENCE
+            self.counter_length = self.sequence.padding
+            self.filepath = self.sequence.pattern
+            self.filename = os.path.basename(self.filepath)
+            self.basename = PurePath(self.filepath).stem
+            self.out_basename = self.sequence.prefix.rstrip('._- ') or 'sequence'
+            self.input_param = ['-framerate', str(self.out_framerate), '-start_number', str(self.sequence.start)]
+        elif has_tags(fn, ffmpeg.sequence_tags):
+            self.type = MediaType.IMAGE
+        elif has_tags(fn, ffmpeg.formats_audio):
+            self.type = MediaType.AUDIO
+        elif has_tags(fn, ffmpeg.formats_video):
+            self.type = MediaType.VIDEO
+        else:
+            self.type = MediaType.DATA
+    
+    def duration(self) -> float | None:
+        if self.sequence is not None:
+            # a probed frame has no useful duration, the sequence runs at the output frame rate
+            return self.sequence.Contiguous() / self.out_framerate
+        duration = parse_time(self.format.get('duration')) if self.format is not None else None
+        if duration is None:
+            durations = [parse_time(stream.get('duration')) for stream in self.streams]
+            duration = max([x for x in durations if x is not None], default=None)
+        return duration
+
+    def fingerprint(self, content: bool = False) -> dict:
+        # what the outputs were made from, sequences sum up all their frames
+        paths = [self.sequence.FramePath(x) for x in self.sequence.numbers] if self.sequence is not None else [self.origpath]
+        stats = [os.stat(path) for path in paths]
+        fingerprint = {'path': os.path.abspath(self.filepath), 'size': sum(x.st_size for x in stats), 'mtime_ns': max(x.st_mtime_ns for x in stats)}
+        if self.sequence is not None:
+            fingerprint['frames'] = [self.sequence.start, self.sequence.end, self.sequence.count]
+        if content:
+            # the head and tail of the first and last file catch rewrites that kept size and mtime
+            digest = hashlib.sha1(str(fingerprint['size']).encode())
+            for path in dict.fromkeys((paths[0], paths[-1])):
+                with open(path, 'rb') as f:
+                    digest.update(f.read(self.HashBytes))
+                    f.seek(max(0, os.fstat(f.fileno()).st_size - self.HashBytes))
+                    digest.update(f.read(self.HashBytes))
+            fingerprint['hash'] = digest.hexdigest()
+        return fingerprint
+
+    def keyframes(self, targets: list[float]) -> list[float]:
+        # packets are read only in a window after each target, not through the whole file
+        start = parse_time(self.format.get('start_time')) or 0.0
+        intervals = ','.join(f'{start + x:.3f}%+{self.KeyframeWindow}' for x in targets)
+        probe_param = [
+                ffmpeg.ffprobeexe,
+                '-v', 'error',
+                '-hide_banner',
+                '-select_streams', 'v:0',
+                '-read_intervals', intervals,
+                '-show_entries', 'packet=pts_time,flags',
+                '-of', 'csv=p=0',
+                self.filepath]
+        try:
+            Metrics.Count('subprocess_spawns')
+            with Metrics.Span('keyframe_probe', file=self.filename):
+                probe = subprocess.run(probe_param, capture_output=True, encoding='utf-8', errors='replace')
+        except OSError as e:
+            log(self, error='Keyframe probe failed', end=str(e))
+            return []
+        keyframes = set()
+        for line in probe.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if flags.startswith('K') and parse_number(pts_time) is not None:
+                keyframes.add(float(pts_time) - start)
+        return sorted(keyframes)
+
+    def frames(self) -> int | None:
+        if self.sequence is not None:
+            return self.sequence.Contiguous()
+        for stream in self.streams:
+            if stream.get('codec_type') == 'video' and parse_number(stream.get('nb_frames')):
+                return int(stream['nb_frames'])
+        return None
+
+    @classmethod
+    def GetIndex(cls, media) -> int:
+        # ids only grow, so the list position is a binary search away
+        index = bisect.bisect_left(cls.Collection, media.id, key=lambda x: x.id)
+        if index == len(cls.Collection) or cls.Collection[index] is not media:
+            raise ValueError(f'{media.filepath} is not in the sources')
+        return index
+    
+    @classmethod
+    def GetIdByFilepath(cls, filepath: str) -> int:
+        return cls.GetByFilepath(filepath).id
+
+    @classmethod
+    def GetById(cls, id: int) -> Self:
+        return cls.ById.get(id)
+
+    @classmethod
+    def GetByIndex(cls, index: int) -> Self:
+        return cls.Collection[index]
+
+    @classmethod
+    def GetByFilepath(cls, filepath: str) -> Self:
+        return cls.ByFilepath.get(filepath)
+    
+    @classmethod
+    def GetIndexByFilepath(cls, filepath: str) -> int:
+        return cls.GetIndex(cls.GetByFilepath(filepath))
+
+    @classmethod
+    def Count(cls) -> int:
+        return len(cls.Collection)
+
+    @classmethod
+    def SetVideo(cls, file_name: str, preset: VideoPresets):
+        cls.ByFilepath[file_name].video_preset = preset
+
+    @classmethod
+    def SetAudio(cls, file_name: str, preset: AudioPresets):
+        cls.ByFilepath[file_name].audio_preset = preset
+
+    @classmethod
+    def ToggleOutput(cls, file_name: str, video_preset: VideoPresets, audio_preset: AudioPresets) -> bool:
+        # adds an extra output pair or removes it when it is already there, returns True when added
+        media = cls.ByFilepath[file_name]
+        pair = (video_preset, audio_preset)
+        if pair in media.outputs:
+            media.outputs.remove(pair)
+            return False
+        if pair == (media.video_preset, media.audio_preset):
+            return False
+        media.outputs.append(pair)
+        return True
+
+    @classmethod
+    def Delete(cls, filepath, quiet: bool = False):
+        media = cls.GetByFilepath(filepath)
+        file_index = cls.GetIndex(media)
+        # a deleted source is not encoded anymore
+        for job in EncodeJobs.Active():
+            if job.media is media:
+                job.cancel()
+        with cls.Lock:
+            cls.Collection.pop(file_index)
+            del cls.ByFilepath[media.filepath]
+            del cls.ById[media.id]
+        Events.Emit(Event.MEDIA_DELETED, media=media, index=file_index)
+        if not quiet:
+            log(text=f'File "{filepath}" deleted.')
+
+class JobState(Enum):
+    QUEUED    = 0, 'Queued'
+    RUNNING   = 1, 'Running'
+    DONE      = 2, 'Done'
+    FAILED    = 3, 'Failed'
+    CANCELLED = 4, 'Cancelled'
+    SKIPPED   = 5, 'Up to date'
+
+    def __init__(self, id: int, doc: str):
+        self.id = id
+        self.doc = doc
+
+class EncodeJobs():
+
+    Collection: list[Self] = []
+    Workers: int = os.cpu_count() or 1
+    Pool: ThreadPoolExecutor = None
+    ProgressInterval = 0.25 # seconds between progress events of one job
+    StderrLines = 200
+    # long sources are cut into parts encoded in parallel and joined with the concat demuxer
+    Segments: int = 0 # parts per source, 0 or 1 encodes each source in one process
+    SegmentSeconds = 30.0 # shortest video part
+    # admission control, jobs share the thread budget and wait while the machine is overloaded
+    ThreadBudget: int = os.cpu_count() or 1 # threads of all running jobs together, 0 leaves ffmpeg defaults
+    MaxLoad: float = (os.cpu_count() or 1) * 1.5 # 1 minute load average that holds back new jobs
+    MinFreeMemory: int = 1024 * 2**20 # bytes
+    AdmitInterval = 2.0 # seconds between checks of a held back job
+    Running = 0 # admitted ffmpeg processes
+    Lock = threading.Lock()
+    # make-style skipping of jobs whose outputs match the sidecar manifests
+    Incremental = False
+    HashSources = False # content fingerprint on top of size and mtime
+    ManifestSuffix = '.ffenc.json'
+    SegmentFrames = 100 # shortest sequence part
+
+    def __init__(self, media: MediaFiles):
+        self.id = EncodeJobs.Count()+1
+        self.media = media
+        self.video_preset: VideoPresets = media.video_preset
+        self.audio_preset: AudioPresets = media.audio_preset
+        self.state = JobState.QUEUED
+        self.future = None
+        self.process: subprocess.Popen = None
+        self.returncode: int = None
+        self.errors: str = ''
+        # live progress from ffmpeg -progress
+        self.duration: float = media.duration()
+        self.frames: int = media.frames()
+        self.started: float = None
+        self.progress: float = None
+        self.out_time: float = None
+        self.fps: float = None
+        self.speed: float = None
+        self.total_size: int = None
+        self.eta: float = None
+        self.logged_step = 0 # last 10% step written to the file log
+        self.queued: float = None
+        self.threads: int = None # share of the thread budget, set by Start
+        self.journal_key: str = None
+        self.parts: list[EncodeSegments] = []
+        self.parts_done = 0
+        self.reported = 0.0
+        self.lock = threading.Lock()
+        self.prepare()
+
+    def prepare(self):
+        # outputs and command line of the job
+        media = self.media
+        self.output = os.path.join(media.out_dir, f'{media.out_basename}.{self.output_format()}')
+        # the primary pair keeps the plain name, extra outputs are named after their presets
+        self.outputs: list[tuple[VideoPresets, AudioPresets, str]] = [(self.video_preset, self.audio_preset, self.output)]
+        for video_preset, audio_preset in media.outputs:
+            suffix = '_'.join(re.sub(r'\W+', '_', preset.name).strip('_') for preset in (video_preset, audio_preset) if preset is not None)
+            output = os.path.join(media.out_dir, f'{media.out_basename}_{suffix}.{self.output_format(video_preset, audio_preset)}')
+            self.outputs.append((video_preset, audio_preset, output))
+        with Metrics.Span('command_build', file=media.filename):
+            self.argv = self.command()
+
+    @classmethod
+    def Add(cls, media: MediaFiles) -> Self:
+        job = cls(media)
+        cls.Collection.append(job)
+        return job
+
+    @classmethod
+    def Count(cls) -> int:
+        return len(cls.Collection)
+
+    @classmethod
+    def Active(cls) -> list[Self]:
+        return [job for job in cls.Collection if job.state in (JobState.QUEUED, JobState.RUNNING)]
+
+    @classmethod
+    def Start(cls, jobs: list[Self]):
+        # the pool is bounded by the number of cores, extra jobs just wait in the queue
+        if cls.Pool is None:
+            cls.Pool = ThreadPoolExecutor(max_workers=cls.Workers, thread_name_prefix='encode')
+        threads = cls.thread_share(len(cls.Active()))
+        for job in jobs:
+            job.queued = time.perf_counter()
+            job.threads = threads
+            job.argv = job.command()
+            JobJournal.Queued(job)
+            if job.segmentable():
+                # the parts and the join run in the pool, the job future only resolves after the join
+                job.future = Future()
+                job.future.set_running_or_notify_cancel()
+                cls.Pool.submit(job.split)
+            else:
+                job.future = cls.Pool.submit(job.run)
+
+    @classmethod
+    def thread_share(cls, jobs: int) -> int | None:
+        # threads per job so the jobs running side by side stay within the budget
+        if not cls.ThreadBudget:
+            return None
+        return max(1, cls.ThreadBudget // max(1, min(cls.Workers, jobs)))
+
+    @classmethod
+    def overloaded(cls) -> str | None:
+        load = system_load()
+        if cls.MaxLoad and load is not None and load > cls.MaxLoad:
+            return f'load {load:.1f} over {cls.MaxLoad:g}'
+        free = free_memory()
+        if cls.MinFreeMemory and free is not None and free < cls.MinFreeMemory:
+            return f'{free // 2**20} MB of memory free'
+        return None
+
+    @classmethod
+    def Cancel(cls):
+        for job in cls.Active():
+            job.cancel()
+
+    def cancel(self):
+        for part in self.parts:
+            part.cancel()
+        if self.future is not None and self.future.cancel():
+            self.set_state(JobState.CANCELLED)
+        else:
+            self.state = JobState.CANCELLED
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+
+    def output_format(self, *presets) -> str:
+        for preset in presets or (self.video_preset, self.audio_preset):
+            if preset is not None and preset.default_format:
+                return preset.default_format
+        return self.media.extension.lstrip('.')
+
+    def command(self, threads: bool = True) -> list:
+        # one input feeds every output, ffmpeg decodes the source once for all of them
+        # without threads it is the recipe of the outputs, the same for any pool size
+        thread_args = self.thread_args if threads else lambda *x: []
+        argv = [ffmpeg.ffmpegexe, '-hide_banner', '-y', '-nostats', '-progress', 'pipe:1', *thread_args('global'), *self.media.input_param, *thread_args('input'), '-i', self.media.filepath]
+        for i, (video_preset, audio_preset, output) in enumerate(self.outputs):
+            for preset, skip in ((video_preset, '-vn'), (audio_preset, '-an')):
+                if preset is not None:
+                    argv += thread_args('output', preset) + PresetCommands.Get(preset)
+                elif i > 0:
+                    # extra outputs only carry the streams of their own presets
+                    argv.append(skip)
+            argv.append(output)
+        return argv
+
+    def thread_args(self, where: str, preset: VideoPresets | AudioPresets = None) -> list:
+        # filter, decoder and encoder threads from the job's share, thread options of the preset come later and win
+        if self.threads is None:
+            return []
+        if where == 'global':
+            return ['-filter_threads', str(self.threads)]
+        if where == 'input':
+            return ['-threads', str(self.threads)]
+        if preset is not None and 'threads' in (preset.encoder.general or []):
+            # the encoders of several outputs run side by side, they split the share
+            return ['-threads', str(max(1, self.threads // len(self.outputs)))]
+        return []
+
+    @contextmanager
+    def admitted(self):
+        # a held back job waits for the load to drop, but never while nothing else runs
+        held = None
+        while self.state != JobState.CANCELLED and EncodeJobs.Running > 0:
+            reason = self.overloaded()
+            if reason is None:
+                break
+            if held is None:
+                held = time.perf_counter()
+                log(self.media, text='Held back,', end=f'{reason}.')
+            time.sleep(self.AdmitInterval)
+        if held is not None:
+            Metrics.Record('admission_wait', time.perf_counter() - held, file=self.media.filename)
+        with EncodeJobs.Lock:
+            EncodeJobs.Running += 1
+        try:
+            yield
+        finally:
+            with EncodeJobs.Lock:
+                EncodeJobs.Running -= 1
+
+    def manifest(self) -> dict:
+        # the ffmpeg path differs between machines, and relative paths between working folders
+        paths = {self.media.filepath, *(output for _, _, output in self.outputs)}
+        recipe = [os.path.abspath(x) if x in paths else x for x in self.command(threads=False)[1:]]
+        return {
+            'version': VERSION,
+            'source': self.media.fingerprint(self.HashSources),
+            'recipe': hashlib.sha1(json.dumps(recipe).encode('utf-8')).hexdigest(),
+            'argv': recipe,
+        }
+
+    def up_to_date(self) -> bool:
+        # every output must exist at the size its manifest recorded, made from the same source by the same recipe
+        try:
+            manifest = self.manifest()
+            for _, _, output in self.outputs:
+                with open(output + self.ManifestSuffix, encoding='utf-8') as f:
+                    previous = json.load(f)
+                if previous.get('source') != manifest['source'] or previous.get('recipe') != manifest['recipe'] or previous.get('size') != os.path.getsize(output):
+                    return False
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def write_manifests(self):
+        try:
+            manifest = self.manifest()
+            for _, _, output in self.outputs:
+                manifest['size'] = os.path.getsize(output)
+                manifest['time'] = dt.datetime.now().isoformat(timespec='seconds')
+                with open(output + self.ManifestSuffix + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=1)
+                os.replace(output + self.ManifestSuffix + '.tmp', output + self.ManifestSuffix)
+        except OSError as e:
+            log(self.media, error='Manifest not written', end=str(e))
+
+    def count_written(self):
+        Metrics.Count('bytes_written', sum(os.path.getsize(output) for _, _, output in self.outputs if os.path.isfile(output)))
+
+    def skipped(self) -> bool:
+        if not self.Incremental or not self.up_to_date():
+            return False
+        self.set_state(JobState.SKIPPED)
+        return True
+
+    def segmentable(self) -> bool:
+        # only re-encoding presets cut cleanly, and image outputs have nothing to join
+        if self.Segments < 2 or len(self.outputs) > 1 or self.video_preset is None or self.video_preset.system:
+            return False
+        if '.' + self.output_format().lower() in ImageSequences.Extensions:
+            return False
+        if self.media.type == MediaType.VIDEO:
+            return (self.duration or 0) >= 2 * self.SegmentSeconds
+        if self.media.type == MediaType.SEQUENCE:
+            return (self.frames or 0) >= 2 * self.SegmentFrames
+        return False
+
+    def split(self):
+        # runs in the pool where nobody reads the result, errors must still resolve the job future
+        try:
+            self.split_parts()
+        except Exception as e:
+            self.abort(e)
+
+    def split_parts(self):
+        if self.state == JobState.CANCELLED:
+            self.join()
+            return
+        if self.skipped():
+            self.future.set_result(self) # nothing to join, the job future resolves here
+            return
+        if self.queued is not None:
+            Metrics.Record('queue_wait', time.perf_counter() - self.queued, file=self.media.filename)
+        self.set_state(JobState.RUNNING)
+        self.started = time.monotonic()
+        count = min(self.Segments, int(self.duration // self.SegmentSeconds) if self.media.type == MediaType.VIDEO else self.frames // self.SegmentFrames)
+        if self.media.type == MediaType.VIDEO:
+            # video is cut at the keyframes nearest after evenly spaced targets
+            keyframes = self.media.keyframes([self.duration * i / count for i in range(1, count)])
+            cuts = []
+            for i in range(1, count):
+                cut = next((x for x in keyframes if x >= self.duration * i / count), None)
+                if cut is not None and 0 < cut < self.duration and (len(cuts) == 0 or cut > cuts[-1]):
+                    cuts.append(cut)
+            bounds = [0.0] + cuts + [self.duration]
+        else:
+            # every frame of a sequence is a keyframe
+            first = self.media.sequence.start
+            bounds = [first + self.frames * i // count for i in range(count + 1)]
+        if len(bounds) < 3:
+            log(self.media, text='No keyframes to cut at, encoding in one part.')
+            with self.admitted():
+                self.execute(self.argv)
+            self.future.set_result(self)
+            return
+        parts_dir = self.output + '.parts'
+        threads = self.thread_share(len(self.Active()) - 1 + len(bounds) - 1) if self.threads is not None else None
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            self.parts.append(EncodeSegments(self, i, start, end - start, os.path.join(parts_dir, f'{i:04d}.{self.output_format()}'), threads))
+        log(self.media, text=f'Encoding in {len(self.parts)} parts', end=f'cut at {", ".join(f"{x:g}" for x in bounds[1:-1])}.')
+        if self.state == JobState.CANCELLED:
+            self.parts = []
+            self.join()
+            return
+        for part in self.parts:
+            part.queued = time.perf_counter()
+            part.future = self.Pool.submit(part.run)
+            part.future.add_done_callback(self.part_done)
+
+    def part_done(self, future: Future):
+        with self.lock:
+            self.parts_done += 1
+            if self.parts_done < len(self.parts):
+                return
+        self.Pool.submit(self.join)
+
+    def join(self):
+        try:
+            self.join_parts()
+        except Exception as e:
+            self.abort(e)
+
+    def join_parts(self):
+        # post-processing of segmented jobs, the concat step and the cleanup
+        with Metrics.Span('post_process', file=self.media.filename):
+            parts_dir = self.output + '.parts'
+            failed = next((part for part in self.parts if part.state != JobState.DONE), None)
+            if self.state == JobState.CANCELLED:
+                self.set_state(JobState.CANCELLED)
+            elif failed is not None:
+                self.returncode = failed.returncode
+                self.errors = failed.errors
+                self.set_state(JobState.FAILED)
+            else:
+                listpath = os.path.join(parts_dir, 'concat.txt')
+                with open(listpath, 'w', encoding='utf-8') as listfile:
+                    for part in self.parts:
+                        listfile.write("file '" + os.path.basename(part.output).replace("'", "'\\''") + "'\n")
+                self.execute(self.join_command(listpath))
+            if self.state != JobState.FAILED:
+                shutil.rmtree(parts_dir, ignore_errors=True)
+            if not self.future.done():
+                self.future.set_result(self)
+
+    def abort(self, e: Exception):
+        self.errors = str(e)
+        for part in self.parts:
+            part.cancel()
+        try:
+            self.set_state(JobState.FAILED)
+        finally:
+            if not self.future.done():
+                self.future.set_result(self)
+
+    def join_command(self, listpath: str) -> list:
+        # parts are copied, the audio of a video source is encoded once here
+        argv = [ffmpeg.ffmpegexe, '-hide_banner', '-y', '-nostats', '-progress', 'pipe:1', '-f', 'concat', '-safe', '0', '-i', listpath]
+        if self.media.type == MediaType.VIDEO:
+            argv += [*self.media.input_param, '-i', self.media.filepath, '-map', '0:v', '-map', '1:a:0?', '-c:v', 'copy']
+            if self.audio_preset is not None:
+                argv += PresetCommands.Get(self.audio_preset)
+        else:
+            argv += ['-c', 'copy']
+        argv.append(self.output)
+        return argv
+
+    def collect(self):
+        # parts report here, the job shows their combined progress
+        now = time.monotonic()
+        with self.lock:
+            if now - self.reported < self.ProgressInterval:
+                return
+            self.reported = now
+        running = [part for part in self.parts if part.state == JobState.RUNNING]
+        self.progress = sum(part.share * (1.0 if part.state == JobState.DONE else part.progress or 0.0) for part in self.parts)
+        self.fps = sum(part.fps or 0.0 for part in running) or None
+        self.speed = sum(part.speed or 0.0 for part in running) or None
+        self.total_size = sum(part.total_size or 0 for part in self.parts)
+        if self.progress:
+            self.eta = (now - self.started) * (1 - self.progress) / self.progress
+        Events.Emit(Event.JOB_PROGRESS, job=self)
+
+    def report(self):
+        Events.Emit(Event.JOB_PROGRESS, job=self)
+
+    def set_state(self, state: JobState):
+        self.state = state
+        if state == JobState.DONE and self.Incremental:
+            self.write_manifests()
+        if self.journal_key is not None:
+            JobJournal.State(self)
+        # workers never touch widgets, the GUI bus forwards this to the main loop
+        Events.Emit(Event.JOB_STATE, job=self)
+
+    def run(self) -> Self:
+        if self.state == JobState.CANCELLED:
+            return self
+        if self.queued is not None:
+            Metrics.Record('queue_wait', time.perf_counter() - self.queued, file=self.media.filename)
+        if self.skipped():
+            return self
+        with self.admitted():
+            if self.state == JobState.CANCELLED:
+                self.set_state(JobState.CANCELLED)
+                return self
+            self.set_state(JobState.RUNNING)
+            self.started = time.monotonic()
+            self.execute(self.argv)
+        return self
+
+    def execute(self, argv: list):
+        try:
+            os.makedirs(os.path.dirname(self.output), exist_ok=True)
+            Metrics.Count('subprocess_spawns')
+            with Metrics.Span('ffmpeg', file=self.media.filename):
+                self.process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8', errors='replace')
+                if self.state == JobState.CANCELLED:
+                    self.process.terminate()
+                # stderr is drained aside so a chatty ffmpeg never blocks the progress pipe
+                stderr = deque(maxlen=self.StderrLines)
+                stderr_reader = threading.Thread(target=stderr.extend, args=(self.process.stderr,), daemon=True)
+                stderr_reader.start()
+                self.read_progress()
+                self.process.wait()
+                stderr_reader.join()
+        except OSError as e:
+            self.errors = str(e)
+            self.set_state(JobState.FAILED)
+            return
+        self.returncode = self.process.returncode
+        self.errors = ''.join(stderr).strip()
+        self.count_written()
+        if self.state == JobState.CANCELLED:
+            self.set_state(JobState.CANCELLED)
+        else:
+            self.set_state(JobState.DONE if self.returncode == 0 else JobState.FAILED)
+
+    def read_progress(self):
+        # ffmpeg writes key=value blocks, each closed by progress=continue or progress=end
+        block = {}
+        emitted = 0.0
+        for line in self.process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                block[key] = value
+                continue
+            self.update_progress(block)
+            block = {}
+            now = time.monotonic()
+            if value == 'end' or now - emitted >= self.ProgressInterval:
+                emitted = now
+                self.report()
+
+    def update_progress(self, block: dict):
+        self.out_time = parse_time(block.get('out_time'))
+        self.fps = parse_number(block.get('fps'))
+        self.speed = parse_number(block.get('speed', '').rstrip('x'))
+        total_size = parse_number(block.get('total_size'))
+        self.total_size = int(total_size) if total_size is not None else None
+        frame = parse_number(block.get('frame'))
+        if self.duration and self.out_time is not None:
+            self.progress = min(1.0, self.out_time / self.duration)
+        elif self.frames and frame is not None:
+            self.progress = min(1.0, frame / self.frames)
+        if self.speed and self.duration and self.out_time is not None:
+            self.eta = max(0.0, (self.duration - self.out_time) / self.speed)
+        elif self.progress:
+            elapsed = time.monotonic() - self.started
+            self.eta = elapsed * (1 - self.progress) / self.progress
+
+    def progress_text(self) -> str:
+        parts = []
+        if self.progress is not None: parts.append(f'{self.progress:.0%}')
+        if self.fps: parts.append(f'{self.fps:g} fps')
+        if self.speed: parts.append(f'{self.speed:g}x')
+        if self.eta is not None: parts.append(f'ETA {dt.timedelta(seconds=round(self.eta))}')
+        return ' '.join(parts)
+
+class EncodeSegments(EncodeJobs):
+
+    # one part of a segmented job, it reports to the job instead of the bus
+    def __init__(self, job: EncodeJobs, index: int, start: float | int, length: float | int, output: str, threads: int = None):
+        super().__init__(job.media)
+        self.job = job
+        self.index = index
+        self.video_preset = job.video_preset
+        self.audio_preset = None # the audio is encoded once at the join
+        self.threads = threads
+        self.output = output
+        self.outputs = [(self.video_preset, None, output)]
+        if self.media.type == MediaType.VIDEO:
+            self.duration, self.frames = length, None
+            self.share = length / job.duration
+            input_param = [*self.media.input_param, '-ss', f'{start:.6f}']
+            output_param = ['-t', f'{length:.6f}', '-map', '0:v:0', '-an']
+        else:
+            self.duration, self.frames = None, length
+            self.share = length / job.frames
+            input_param = ['-framerate', str(self.media.out_framerate), '-start_number', str(start)]
+            output_param = ['-frames:v', str(length)]
+        self.argv = [ffmpeg.ffmpegexe, '-hide_banner', '-y', '-nostats', '-progress', 'pipe:1', *self.thread_args('global'), *input_param, *self.thread_args('input'), '-i', self.media.filepath, *output_param, *self.thread_args('output', self.video_preset), *PresetCommands.Get(self.video_preset), self.output]
+
+    def prepare(self):
+        # the part builds its own command line once it knows its range
+        pass
+
+    def set_state(self, state: JobState):
+        self.state = state
+
+    def skipped(self) -> bool:
+        # the job checked its outputs once before splitting
+        return False
+
+    def count_written(self):
+        # parts are deleted after the join, only the joined output counts
+        pass
+
+    def report(self):
+        self.job.collect()
+
+class JobJournal():
+
+    # append-only JSON lines of queued jobs and their state changes, --resume picks up what a crash left behind
+    Filename = 'journal.jsonl'
+    Path: str = None # None until Open, jobs are not journaled then
+    File = None
+    Lock = threading.Lock()
+
+    @classmethod
+    def Open(cls, path: str = None, rotate: bool = True) -> list[dict]:
+        # a finished journal is moved aside, the unfinished jobs of an open one are returned
+        cls.Path = path or os.path.join(user_dir(), cls.Filename)
+        unfinished = cls.Unfinished()
+        if rotate and len(unfinished) == 0 and os.path.isfile(cls.Path):
+            os.replace(cls.Path, cls.Path + '.1')
+        return unfinished
+
+    @staticmethod
+    def key(job: EncodeJobs) -> str:
+        state = json.dumps([os.path.abspath(job.media.origpath), [os.path.abspath(output) for _, _, output in job.outputs]])
+        return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def Queued(cls, job: EncodeJobs):
+        job.journal_key = cls.key(job)
+        cls.write({
+            'job': job.journal_key,
+            'state': JobState.QUEUED.name,
+            # absolute paths, --resume may run from another folder
+            'source': os.path.abspath(job.media.origpath),
+            'out_dir': os.path.abspath(job.media.out_dir),
+            'outputs': [[x.name if x is not None else None for x in (video_preset, audio_preset)] + [os.path.abspath(output)] for video_preset, audio_preset, output in job.outputs],
+            'argv': job.argv,
+        })
+
+    @classmethod
+    def State(cls, job: EncodeJobs):
+        record = {'job': job.journal_key, 'state': job.state.name, 'returncode': job.returncode}
+        if job.state == JobState.DONE:
+            record['sizes'] = {os.path.abspath(output): os.path.getsize(output) for _, _, output in job.outputs if os.path.isfile(output)}
+        cls.write(record)
+
+    @classmethod
+    def write(cls, record: dict):
+        if cls.Path is None:
+            return
+        record['time'] = time.time()
+        line = json.dumps(record, default=str) + '\n'
+        with cls.Lock:
+            if cls.File is None:
+                os.makedirs(os.path.dirname(os.path.abspath(cls.Path)), exist_ok=True)
+                cls.File = open(cls.Path, 'a', encoding='utf-8')
+            # every line reaches the disk before the job moves on, a crash loses at most the line being written
+            cls.File.write(line)
+            cls.File.flush()
+            os.fsync(cls.File.fileno())
+
+    @classmethod
+    def Unfinished(cls) -> list[dict]:
+        # the latest state of each job folded into its queued record
+        jobs: dict[str, dict] = {}
+        try:
+            with open(cls.Path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # torn last line of a crash
+                    if record.get('state') == JobState.QUEUED.name:
+                        jobs[record['job']] = record
+                    elif record.get('job') in jobs:
+                        jobs[record['job']].update(record)
+        except OSError:
+            return []
+        return [job for job in jobs.values() if not cls.verified(job)]
+
+    @staticmethod
+    def verified(job: dict) -> bool:
+        # failed and cancelled jobs were given up on purpose, skipped ones were checked against their manifests,
+        # done ones must still have their outputs as written
+        if job['state'] in (JobState.FAILED.name, JobState.CANCELLED.name, JobState.SKIPPED.name):
+            return True
+        if job['state'] != JobState.DONE.name:
+            return False
+        sizes = job.get('sizes', {})
+        return all(os.path.isfile(output) and os.path.getsize(output) == sizes.get(output) for _, _, output in job['outputs'])
+
+    @classmethod
+    def Resume(cls) -> dict[str, tuple]:
+        # source: (video preset, audio preset, extra outputs, output folder) of every unfinished job
+        resumed = {}
+        for job in cls.Unfinished():
+            presets = []
+            for vname, aname, output in job['outputs']:
+                pair = (VideoPresets.GetPresetByName(vname) if vname is not None else None, AudioPresets.ByName(aname) if aname is not None else None)
+                if (vname is not None and pair[0] is None) or (aname is not None and pair[1] is None):
+                    log(error='Preset is gone, not resuming', file=job['source'], end=f'{vname} / {aname}')
+                    break
+                presets.append(pair)
+                # partial outputs of an interrupted run are encoded again from the start
+                if os.path.isfile(output): os.remove(output)
+                shutil.rmtree(output + '.parts', ignore_errors=True)
+            else:
+                resumed[job['source']] = (*presets[0], presets[1:], job['out_dir'])
+        return resumed
+
+class WatchFolders():
+
+    # hot folders of --watch, each new file is handed over once it alone has not changed for Settle seconds
+    Collection: list[Self] = []
+    Settle = 5.0 # seconds without size or mtime changes, half-copied files keep changing
+    Poll = 1.0 # seconds between scans while files settle, or always without inotify
+    Rescan = 60.0 # seconds an idle inotify wait lasts, in case events were lost
+    Ignore = ('.part', '.partial', '.tmp', '.crdownload', EncodeJobs.ManifestSuffix) # names of copies in progress and of our own files
+    Inotify: int = None # descriptor on Linux, None polls
+    Mask = 0x2 | 0x8 | 0x80 | 0x100 # IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE
+    libc = None
+
+    def __init__(self, folder: str):
+        self.folder = os.path.abspath(folder)
+        self.seen: dict[str, tuple] = {} # handed over files with their size and mtime, a changed file comes back
+        self.pending: dict[str, tuple] = {} # settling files with their size, mtime and the time either last changed
+        if WatchFolders.Inotify is not None and WatchFolders.libc.inotify_add_watch(WatchFolders.Inotify, os.fsencode(self.folder), self.Mask) < 0:
+            log(error=f'inotify failed ({os.strerror(ctypes.get_errno())}), polling', file=self.folder)
+            os.close(WatchFolders.Inotify)
+            WatchFolders.Inotify = None
+
+    @classmethod
+    def Add(cls, folder: str) -> Self:
+        if len(cls.Collection) == 0:
+            cls.inotify_init()
+        item = cls(folder)
+        cls.Collection.append(item)
+        return item
+
+    @classmethod
+    def inotify_init(cls):
+        try:
+            cls.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = cls.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return # not Linux
+        if fd >= 0:
+            cls.Inotify = fd
+
+    @classmethod
+    def Settled(cls) -> list[str]:
+        paths = []
+        for item in cls.Collection:
+            paths += item.settled()
+        return paths
+
+    @classmethod
+    def Wait(cls):
+        # settling files are polled, inotify only ends idle waits early
+        if cls.Inotify is None or any(len(item.pending) > 0 for item in cls.Collection):
+            time.sleep(cls.Poll)
+        else:
+            select.select([cls.Inotify], [], [], cls.Rescan)
+        if cls.Inotify is not None:
+            try:
+                while os.read(cls.Inotify, 65536): pass # the events only wake us, the scan sees what changed
+            except BlockingIOError:
+                pass
+
+    def settled(self) -> list[str]:
+        now = time.monotonic()
+        current = {}
+        try:
+            for entry in os.scandir(self.folder):
+                if entry.name.startswith('.') or entry.name.endswith(self.Ignore) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if stat.st_size > 0: # just created, nothing to probe yet
+                    current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            log(error=f'Watch folder unreadable ({e.strerror})', file=self.folder)
+            return []
+        for path, key in current.items():
+            if self.seen.get(path) != key and self.pending.get(path, (None, None))[:2] != key:
+                self.pending[path] = (*key, now)
+        # moved away or deleted before settling
+        self.pending = {path: item for path, item in self.pending.items() if path in current}
+        self.seen = {path: key for path, key in self.seen.items() if path in current}
+        paths = sorted(path for path, item in self.pending.items() if now - item[2] >= self.Settle)
+        for path in paths:
+            self.seen[path] = self.pending.pop(path)[:2]
+        return paths
+
+class FFmpeg():
+    formats_video = ['mp4','mov','webm','dnxhd','mxf','avi','mpeg','mpegts','dv','flv','matroska','apng','exr','gif','jpg','png','tif','dds']
+    #codecs_video =  ['prores','libx264','libx265', 'h264_nvenc','hevc_nvenc','h264_qsv','hevc_qsv','libvpx-vp9','vp9_qsv','mpeg2video','mpeg2_qsv','libx265dnxhd','mpegts','dvvideo','flv1','gif','apng','png','mjpeg','tiff','dds','HDR','WebP']
+    color_spaces =  ['bt709', 'bt2020nc', 'bt2020c', 'rgb', 'bt470bg', 'smpte170m', 'smpte240m', 'smpte2085', 'ycocg']
+    color_ranges =  ['tv', 'pc', 'mpeg', 'jpeg']
+    formats_audio = ['Video container','ac3','wav','mp3','ogg','flac','aiff','alac']
+    codecs_audio =  ['aac','ac3','flac','alac','dvaudio','pcm_s16le','pcm_s24le','pcm_s32le','pcm_f32le']
+    sequence_tags = ['image2','pipe']
+    default_path = 'C:\\Program Files\\ffmpeg\\bin\\' if sys.platform == 'win32' else ''
+
+    # media properties interpreter, only these get displayed in info box
+    stream_properies = {
+        'Codec': { 
+            'codec_name': 'Name',
+            'codec_tag_string': 'Tag',
+            'profile': 'Profile',
+            'pix_fmt': 'Color coding',
+            'bits_per_raw_sample': 'Bit depth',
+            'bit_rate': 'Bit rate',
+            'max_bit_rate': 'Max bitrate'
+        },
+        'Dimensions': {
+            'width': 'Width',
+            'height': 'Height',
+            'sample_aspect_ratio': 'Pixel ratio',
+            'display_aspect_ratio': 'Frame ratio',
+        },
+        'Sampling': {
+            'sample_rate': 'Sampling rate',
+            'channel_layout': 'Channels'
+        },
+        'Time': {
+            'r_frame_rate': 'Frame rate',
+            'avg_frame_rate': 'Average frame rate',
+            'time_base': 'Time base',
+            'start_time': 'Start',
+            'duration': 'Duration',
+            'nb_frames': 'Frames'
+        },
+        'Color': {
+            'color_range': 'Range',
+            'color_space': 'Colorspace',
+            'color_primaries': 'Primaries',
+            'color_transfer': 'Transfer function'
+        },
+        'Tags': {
+            'TAG:LANGUAGE': 'Language',
+            'TAG:TITLE': 'Title',
+            'TAG"DURATION': 'Duration',
+            'TAG:CREATION_TIME': 'Created',
+            'TAG:ENCODER': 'Encoder',
+            'TAG:HANDLER_NAME': 'Handler',
+            'TAG:VENDOR_ID': 'Vendor'
+        }
+    }
+
+    format_properties = {
+        'Format': {
+            'format_name': 'Format name',
+            'format_long_name': 'Format long name',
+            'nb_streams': 'Nubmer of streams',
+            'start_time': 'Start',
+            'duration': 'Duration',
+            'size': 'Size',
+            'bit_rate': 'Bit rate',
+            'TAG:CREATION_TIME': 'Created',
+            'TAG:ENCODER': 'Encoder',
+            'TAG:MAJOR_BRAND': 'Brand'
+        }
+
+    }
+  
+    def __init__(self, path: str = None):
+        # without a path the executables are looked up in PATH
+        exe = '.exe' if sys.platform == 'win32' else ''
+        self.path = path if path is not None else self.default_path
+        if self.path:
+            self.ffmpegexe = os.path.join(self.path, 'ffmpeg' + exe)
+            self.ffprobeexe = os.path.join(self.path, 'ffprobe' + exe)
+        else:
+            self.ffmpegexe = shutil.which('ffmpeg') or 'ffmpeg' + exe
+            self.ffprobeexe = shutil.which('ffprobe') or 'ffprobe' + exe
+        my_file = Path(self.ffmpegexe)
+        if my_file.is_file():
+            log(text=f'FFmpeg executable found at {self.ffmpegexe}')
+        else:
+            log(text=f'FFmpeg executable not found at {self.ffmpegexe}')
+        my_file = Path(self.ffprobeexe)
+        if my_file.is_file():
+            log(text=f'FFprobe executable found at {self.ffprobeexe}')
+        else:
+            log(text=f'FFprobe executable not found at {self.ffprobeexe}')
+
+class Metrics():
+
+    # named timing spans and counters of the hot paths, exported as JSON lines or Prometheus text
+    Spans: dict[str, list] = {} # name: [count, seconds, max seconds]
+    Counters: dict[str, float] = {}
+    Records: deque[dict] = deque(maxlen=100000) # single spans for the JSON lines export
+    Lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def Span(cls, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.Record(name, time.perf_counter() - start, **labels)
+
+    @classmethod
+    def Record(cls, name: str, seconds: float, **labels):
+        with cls.Lock:
+            span = cls.Spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+            cls.Records.append({'span': name, 'time': time.time(), 'seconds': round(seconds, 6), **labels})
+
+    @classmethod
+    def Count(cls, name: str, value: float = 1):
+        with cls.Lock:
+            cls.Counters[name] = cls.Counters.get(name, 0) + value
+
+    @classmethod
+    def Save(cls, path: str):
+        # .prom files are for the node exporter textfile collector, anything else gets JSON lines
+        with cls.Lock:
+            text = cls.prometheus() if path.endswith('.prom') else cls.json_lines()
+        # written aside and swapped in, a collector never reads half a file
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def json_lines(cls) -> str:
+        lines = [json.dumps(record, default=str) for record in cls.Records]
+        lines += [json.dumps({'summary': name, 'count': count, 'seconds': round(seconds, 6), 'max': round(longest, 6)}) for name, (count, seconds, longest) in cls.Spans.items()]
+        lines += [json.dumps({'counter': name, 'value': value}) for name, value in cls.Counters.items()]
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def prometheus(cls) -> str:
+        lines = ['# HELP ffenc_span_seconds Time spent in the named span.', '# TYPE ffenc_span_seconds summary']
+        for name, (count, seconds, longest) in cls.Spans.items():
+            lines += [f'ffenc_span_seconds_sum{{span="{name}"}} {seconds:.6f}', f'ffenc_span_seconds_count{{span="{name}"}} {count}']
+        lines += ['# HELP ffenc_span_seconds_max Longest single span.', '# TYPE ffenc_span_seconds_max gauge']
+        lines += [f'ffenc_span_seconds_max{{span="{name}"}} {longest:.6f}' for name, (count, seconds, longest) in cls.Spans.items()]
+        for name, value in cls.Counters.items():
+            lines += [f'# TYPE ffenc_{name}_total counter', f'ffenc_{name}_total {value:g}']
+        return '\n'.join(lines) + '\n'
+
+class Event(Enum):
+    LOG           = 0, 'Log message'
+    PRESET_ADDED  = 1, 'Preset added'
+    MEDIA_ADDED   = 2, 'Media added'
+    MEDIA_DELETED = 3, 'Media deleted'
+    PROBE_DONE    = 4, 'Probe done'
+    JOB_STATE     = 5, 'Job state changed'
+    JOB_PROGRESS  = 6, 'Job progress'
+    PRESET_DELETED = 7, 'Preset deleted'
+
+    def __init__(self, id: int, doc: str):
+        self.id = id
+        self.doc = doc
+
+class Events():
+
+    # observer bus between the model and whatever frontend subscribes
+    Subscribers: dict[Event, list] = {}
+    BatchSubscribers: dict[Event, list] = {}
+    Marshal = None # i.e. wx.CallAfter, without it handlers run in the emitting thread
+    Pending: list[tuple[Event, dict]] = []
+    Scheduled = False
+    Flushing = False
+    Lock = threading.Lock()
+
+    @classmethod
+    def Subscribe(cls, event: Event, handler, batch: bool = False):
+        # batch handlers get a list of payloads once per flush instead of a call per event
+        subscribers = cls.BatchSubscribers if batch else cls.Subscribers
+        subscribers.setdefault(event, []).append(handler)
+
+    @classmethod
+    def Unsubscribe(cls, event: Event, handler):
+        for subscribers in (cls.Subscribers, cls.BatchSubscribers):
+            if handler in subscribers.get(event, []):
+                subscribers[event].remove(handler)
+
+    @classmethod
+    def Emit(cls, event: Event, **payload):
+        if cls.Marshal is None or (threading.current_thread() is threading.main_thread() and not cls.Flushing):
+            cls.dispatch([(event, payload)])
+            return
+        # worker events (and events raised by handlers during a flush) queue up for one marshalled flush
+        with cls.Lock:
+            cls.Pending.append((event, payload))
+            if cls.Scheduled:
+                return
+            cls.Scheduled = True
+        cls.Marshal(cls.flush)
+
+    @classmethod
+    def flush(cls):
+        # whatever happens in this flush, the next emit must be able to schedule another one
+        with cls.Lock:
+            cls.Scheduled = False
+        cls.Flushing = True
+        try:
+            while True:
+                with cls.Lock:
+                    pending, cls.Pending = cls.Pending, []
+                if len(pending) == 0:
+                    break
+                cls.dispatch(pending)
+        finally:
+            cls.Flushing = False
+            with cls.Lock:
+                cls.Scheduled = False
+
+    @classmethod
+    def dispatch(cls, pending: list[tuple[Event, dict]]):
+        batches: dict[Event, list] = {}
+        for event, payload in pending:
+            for handler in cls.Subscribers.get(event, []):
+                cls.call(event, handler, **payload)
+            if event in cls.BatchSubscribers:
+                batches.setdefault(event, []).append(payload)
+        for event, payloads in batches.items():
+            for handler in cls.BatchSubscribers[event]:
+                cls.call(event, handler, payloads)
+
+    @staticmethod
+    def call(event: Event, handler, *args, **kwargs):
+        # a failing handler must not drop the rest of the batch
+        try:
+            handler(*args, **kwargs)
+        except Exception as e:
+            if event == Event.LOG:
+                sys.stderr.write(f'{event.doc} handler {getattr(handler, "__name__", handler)} failed: {e!r}\n') # logging it would fail the same way
+            else:
+                log(error=f'{event.doc} handler {getattr(handler, "__name__", handler)} failed:', end=repr(e))
+
+def log(media: 'MediaFiles' = None, **kwargs): # kw = {'text', 'file', 'error', 'end'}
+    kwargs.setdefault('time', dt.datetime.now())
+    if media is not None:
+        media.log.Add(kwargs)
+    Events.Emit(Event.LOG, media=media, **kwargs)
+
+def log_line(record: dict) -> str:
+    timestamp = dt.datetime.strftime(record.get('time') or dt.datetime.now(), '%H:%M:%S')
+    parts = [str(record[key]) for key in ('text', 'file', 'error', 'end') if record.get(key) is not None]
+    return ' '.join([timestamp, *parts])
+
+def console_log(media: 'MediaFiles' = None, **kwargs):
+    line = log_line(kwargs)
+    if media is not None: line = line.replace(' ', f' [{media.filename}] ', 1)
+    # one write per line with its newline, workers log concurrently
+    stream = sys.stderr if kwargs.get('error') is not None else sys.stdout
+    stream.write(line + '\n')
+    stream.flush()
+
+def console_job(job: 'EncodeJobs'):
+    if job.state == JobState.FAILED:
+        console_log(job.media, error=f'Encoding failed ({job.returncode}):', end=job.errors)
+    elif job.state != JobState.QUEUED:
+        console_log(job.media, text=job.state.doc, file=job.output)
+
+def console_progress(job: 'EncodeJobs'):
+    # a line per 10% step is enough for logs of headless runs
+    step = int((job.progress or 0) * 10)
+    if step > job.logged_step:
+        job.logged_step = step
+        console_log(job.media, text='Progress', end=job.progress_text())
+
+Events.Subscribe(Event.PROBE_DONE, MediaFiles.probed)
+
+ffmpeg: 'FFmpeg' = None
+
+def system_load() -> float | None:
+    # 1 minute load average, psutil emulates it on Windows
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return psutil.getloadavg()[0] if psutil is not None else None
+
+def free_memory() -> int | None:
+    # available bytes, page cache that can be dropped counts as free
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def user_dir() -> str:
+    # per-user storage for caches and settings
+    if sys.platform == 'win32':
+        return os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'FFEnc')
+    return os.path.join(os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config')), 'ffenc')
+
+def parse_number(value: str) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_time(value: str) -> float | None:
+    # seconds from plain or sexagesimal ffmpeg times, N/A and negative times give None
+    if value is None or value == 'N/A':
+        return None
+    seconds = 0.0
+    for part in str(value).split(':'):
+        number = parse_number(part)
+        if number is None:
+            return None
+        seconds = seconds * 60 + number
+    return seconds if seconds >= 0 else None
+
+def has_tags(text: str, tag_list: list) -> bool:
+    return any(item in text for item in tag_list)
+
+
+def load_defaults():
+    # built-in encoders and presets
+    set_encoders = [
+        {   #0
+            'name':            'No video',
+            'type':            MediaType.VIDEO,
+            'system':          True,
+            'options':         {
+                'ffoption': None
+            }
+        },
+        {   #1
+            'name':            'Video stream copy',
+            'type':            MediaType.VIDEO,
+            'system':          True,
+            'options':         {
+                'ffoption': '-c:v copy'
+            }
+        },
+        {   #2
+            'name':            'No audio',
+            'type':            MediaType.AUDIO,
+            'system':          True,
+            'options':         {
+                'ffoption': None
+            }
+        },
+        {   #3
+            'name':            'Audio stream copy',
+            'type':            MediaType.AUDIO,
+            'system':          True,
+            'options':         {
+                'ffoption': '-c:a copy'
+            }
+        },
+        {   #4
+            'name':            'libx264',
+            'type':            MediaType.VIDEO, 'system': False,
+            'general':         ['dr1', 'delay', 'threads'],
+            'threading':       ['other'],
+            'formats':         ['mp4', 'mov'],
+            'audio_codecs':    ['aac', 'ac3', 'mp3', 'dts', 'mp2', 'alac', 'dvaudio'],
+            'options':         {
+                'Encoder options': True,
+                'Color coding': {
+                    'ffoption': '-pix_fmt',
+                    'values': ['yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p', 'yuv420p10le', 'yuv422p10le', 'yuv444p10le', 'gray', 'gray10le'],
+                    'current': 'yuv420p',
+                    'doc': 'Pixel format/chroma subsampling mode. 10 or 16 in the names states the bitdepth.',
+                    'fixed': True
+                },
+                'Preset': {
+                    'ffoption': '-preset',
+                    'values': ['medium', 'ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'slow', 'veryslow', 'placebo'],
+                    'current': 'slow',
+                    'doc': 'Sets the encoding preset.',
+                    'fixed': False,
+                },
+                'Profile': {
+                    'ffoption': '-profile:v',
+                    'values': ['baseline', 'main', 'high', 'high10', 'high422', 'high444'],
+                    'current': 'high',
+                    'doc': 'Encoding profile. High10, high422 and high444 modes support 10-bit color.',
+                    'fixed': True,
+                },
+                'Encoder rate control': True,
+                'Rate control': {
+                    'values': [
+                        {
+                            'name': 'Constant quality',
+                            'ffoption': '-crf',
+                            'doc': 'Constant quality mode.',
+                            'suboptions': [
+                                {
+                                'name': 'Quality',
+                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '50'],
+                                'current': '-1',
+                                'doc': 'Selects the quality for constant quality mode.',
+                                'fixed': False,
+                                },
+                                {
+                                'name': 'Max quality',
+                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '50'],
+                                'current': '-1',
+                                'doc': 'Prevents VBV from lowering quality beyond this point.',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name':'Constant quantization',
+                            'ffoption': '-qp',
+                            'doc': 'Constant quantization mode.',
+                            'suboptions': [ 
+                                {
+                                'name': 'Quality',
+                                'values': ['-1', '5', '10', '20', '25', '30', '40', '51'],
+                                'current': '25',
+                                'doc': 'Constant quantization parameter',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'AQ mode',
+                            'ffoption': '-aq-mode',
+                            'doc': 'AQ mode',
+                            'suboptions': [
+                                {
+                                'name': 'AQ method',
+                                'values': ['-1', '0', '1', '2', '3'],
+                                'current': '-1',
+                                'doc': 'AQ method number',
+                                'fixed': True,
+                                },
+                                {
+                                'name': 'AQ strength',
+                                'values': ['-1', '0', '10', '20', '50', '100', '500'],
+                                'current': '-1',
+                                'doc': 'Reduces blocking and blurring in flat and textured areas.',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                    ],
+                    'current': 'Constant quality',
+                    'doc': 'Rate control mode',
+                    'fixed': True,
+                },
+                'Encoder tune': True,
+                'Tune': {
+                    'ffoption': '-tune',
+                    'values': ['film', 'grain', 'animation', 'zerolatency', 'fastdecode', 'stillimage'],
+                    'current': 'film', 
+                    'doc': 'Tune the encoding params.',
+                    'fixed': True,
+                },
+                'Lookahead': {
+                    'ffoption': '-rc-lookahead',
+                    'values': ['-1', '5', '10', '25', '30', '50', '100'],
+                    'current': '25',
+                    'doc': 'Number of frames to look ahead for frametype and ratecontrol.',
+                    'fixed': False,
+                },
+            }
+        },
+        {   #5
+            'name':            'h264_nvenc',
+            'type':            MediaType.VIDEO,
+            'system':          False,
+            'general':         ['dr1', 'delay', 'hardware'],
+            'threading':       ['none'],
+            'formats':         ['mp4', 'mov'],
+            'audio_codecs':    ['aac', 'ac3', 'mp3', 'dts', 'mp2', 'alac', 'dvaudio'],
+            'devices':         ['cuda', 'd3d11va'],
+            'options':         {
+                'Encoder options': True,
+                'Color coding': {
+                    'ffoption': '-pix_fmt',
+                    'values': ['yuv420p', 'yuv444p', 'yuv444p16le', 'p010le', 'p016le', 'bgr0', 'bgra', 'rgb0', 'rgba'],
+                    'current': 'yuv420p',
+                    'doc': 'Pixel format/chroma subsampling mode. 10 or 16 in the names states the bitdepth.',
+                    'fixed': False,
+                },
+                'Preset': {
+                    'ffoption': '-preset',
+                    'values': ['p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7'],
+                    'current': 'p6',
+                    'doc': 'Encoding preset',
+                    'fixed': False,
+                },
+                'Profile': {
+                    'ffoption': '-profile:v',
+                    'values': ['baseline', 'main', 'high', 'high444p'],
+                    'current': 'high',
+                    'doc': 'Encoding profile',
+                    'fixed': True,
+                },
+                'Encoder rate control': True,
+                'Rate control': {
+                    'values': [
+                        {
+                            'name': 'Auto by preset',
+                            'ffoption': '-rc -1',
+                            'doc': 'Rate/quality controlled by the Preset',
+                        },
+                        {
+                            'name': 'Constant QP mode',
+                            'ffoption': '-rc constqp',
+                            'suboptions': [
+                                {
+                                'name': 'Quality',
+                                'ffoption': '-qp',
+                                'values': ['-1', '0', '5', '10', '20', '25', '30', '40', '51'],
+                                'current': '0',
+                                'doc': 'Constant QP mode',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'Variable bitrate',
+                            'ffoption': '-rc vbr',
+                            'suboptions': [
+                                {
+                                'name':'Quality',
+                                'ffoption': '-cq',
+                                'values': ['0', '5', '10', '20', '25', '30', '40', '51'],
+                                'current': '0',
+                                'doc': 'Variable bitrate mode',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'Constant bitrate',
+                            'ffoption': '-rc cbr',
+                            'suboptions': [
+                                {
+                                'name': 'Bitrate', 
+                                'ffoption': '-b:v',
+                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
+                                'current': '8M',
+                                'doc': 'Constant bitrate mode',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'Constant bitrate low delay HQ',
+                            'ffoption': '-rc cbr_ld_hq',
+                            'suboptions': [
+                                {
+                                'name': 'Bitrate', 
+                                'ffoption': '-b:v',
+                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
+                                'current': '8M',
+                                'doc': 'Constant bitrate low delay high quality',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'Constant bitrate HQ',
+                            'ffoption': '-rc cbr_hq',
+                            'suboptions': [
+                                {
+                                'name': 'Bitrate', 
+                                'ffoption': '-b:v',
+                                'values': ['256k', '512k', '1M', '2M', '4M', '8M', '12M', '20M', '30M', '40M'],
+                                'current': '8M',
+                                'doc': 'Constant bitrate high quality mode',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                        {
+                            'name': 'Variable bitrate HQ',
+                            'ffoption': '-rc vbr_hq',
+                            'suboptions': [
+                                {
+                                'name':'Quality',
+                                'ffoption': '-cq',
+                                'values': ['0', '5', '10', '20', '25', '30', '40', '51'],
+                                'current': '0',
+                                'doc': 'Variable bitrate high quality',
+                                'fixed': False,
+                                },
+                            ],
+                        },
+                    ],
+                    'current': 'Auto by preset',
+                    'doc': 'Overrides the preset rate-control',
+                    'fixed': True,
+                },
+                'Encoder tune': True,
+                'Tune': {
+                    'ffoption': '-tune',
+                    'values': ['hq', 'll', 'ull', 'lossless'],
+                    'current': 'hq',
+                    'doc': 'Sets the encoding tuning info',
+                    'fixed': True,
+                },
+                'Lookahead': {
+                    'ffoption': '-rc-lookahead',
+                    'values': ['-1', '5', '10', '25', '30', '50', '100'],
+                    'current': '25',
+                    'doc': 'Number of frames to look ahead for rate-control',
+                    'fixed': False,
+                },
+            }
+        },
+        {   #6
+            'name':            'aac',
+            'type':            MediaType.AUDIO,
+            'system':          False,
+            'general':         ['dr1', 'delay', 'small'],
+            'threading':       ['none'],
+            'formats':         ['aac', 'mp4'],
+            'sample_rates':    [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350],
+            'channel_layouts': [],
+            'sample_formats':  ['fltp'],
+            'options':         {
+                'Encoder options': True,
+                'Coder': {
+                    'ffoption': '-aac_coder', 
+                    'values': ['anmr', 'twoloop', 'fast'],
+                    'current': 'twoloop',
+                    'doc': 'Coding algorithm: ANMR, Two loop searching, Default fast search.',
+                    'fixed': True,
+                },
+                'Force M/S stereo coding': {
+                    'ffoption': '-aac_ms', 
+                    'values': ['auto', 'true', 'false'],
+                    'current': 'auto',
+                    'doc': 'Force M/S stereo coding',
+                    'fixed': True,                
+                },
+                'Intensity stereo coding': {
+                    'ffoption': '-aac_is', 
+                    'values': ['true', 'false'],
+                    'current': 'true',
+                    'doc': 'Intensity stereo coding',
+                    'fixed': True,                
+                },
+                'Perceptual noise substitution': {
+                    'ffoption': '-aac_pns', 
+                    'values': ['true', 'false'],
+                    'current': 'true',
+                    'doc': 'Perceptual noise substitution',
+                    'fixed': True,                
+                },
+                'Temporal noise shaping': {
+                    'ffoption': '-aac_tns', 
+                    'values': ['true', 'false'],
+                    'current': 'true',
+                    'doc': 'Temporal noise shaping',
+                    'fixed': True,                
+                },
+                'Long term prediction': {
+                    'ffoption': '-aac_ltp', 
+                    'values': ['true', 'false'],
+                    'current': 'false',
+                    'doc': 'Long term prediction',
+                    'fixed': True,                
+                },
+                'AAC-Main prediction': {
+                    'ffoption': '-aac_pred', 
+                    'values': ['true', 'false'],
+                    'current': 'false',
+                    'doc': 'AAC-Main prediction',
+                    'fixed': True,                
+                },
+                'Use PCEs': {
+                    'ffoption': '-aac_pce', 
+                    'values': ['true', 'false'],
+                    'current': 'false',
+                    'doc': 'Forces the use of PCEs',
+                    'fixed': True,                
+                },
+            }
+        },
+        {   #7
+            'name':            'ac3',
+            'type':            MediaType.AUDIO,
+            'system':          False,
+            'general':         ['dr1'],
+            'threading':       ['none'],
+            'formats':         ['aac', 'mp4'],
+            'sample_rates':    [48000, 44100, 32000],
+            'channel_layouts': ['mono', 'stereo', '3.0(back)', '3.0 quad(side)', 'quad 4.0', '5.0(side)', '5.0 2channels (FC+LFE)', ' 2.1 4 channels (FL+FR+LFE+BC)', '3.1', '4.1', '5.1(side)', '5.1'],
+            'sample_formats':  ['fltp'],
+            'options':         {
+                'Encoder options': True,
+                'Center Mix Level': {
+                    'ffoption': '-center_mixlev', 
+                    'values': ['0', '0.594604', '1'],
+                    'current': '0.594604',
+                    'doc': 'Center Mix Level',
+                    'fixed': False,
+                },
+                'Surround Mix Level': {
+                    'ffoption': '-surround_mixlev', 
+                    'values': ['0', '0.5', '1'],
+                    'current': '0.5',
+                    'doc': 'Surround Mix Level',
+                    'fixed': False,
+                },
+                'Mixing Level': {
+                    'ffoption': '-mixing_level', 
+                    'values': ['-1', '10', '20', '30', '50', '80', '111'],
+                    'current': '-1',
+                    'doc': 'Mixing Level',
+                    'fixed': False,
+                },
+                'Copyright Bit': {
+                    'ffoption': '-copyright', 
+                    'values': ['-1', '0', '1'],
+                    'current': '-1',
+                    'doc': 'Copyright Bit',
+                    'fixed': True,
+                },
+            }   
+        },
+        {   #8
+            'name':            'pcm_s16le',
+            'type':            MediaType.AUDIO,
+            'system':          False,
+            'general':         ['dr1', 'variable'],
+            'threading':       ['none'],
+            'formats':         ['wav', 'mov'],
+            'sample_rates':    [],
+            'channel_layouts': [],
+            'sample_formats':  ['s16'],
+            'options':         {
+                'Encoder options': False,
+            }
+        },
+    ]
+
+    for encoder in set_encoders:
+        Encoders.Add(**encoder)
+
+    set_audio_presets = [
+        {
+            'name':            'No audio',
+            'encoder':         Encoders.ByName('No audio'), 
+            'default_format':  '',
+            'system':          True,
+        },
+        {
+            'name':            'Stream copy',
+            'encoder':         Encoders.ByName('Audio stream copy'), 
+            'default_format':  '',
+            'system':          True,
+        },
+        {
+            'name':            'aac',
+            'encoder':         Encoders.ByName('aac'),
+            'default_format':  'aac',
+            'system':          False,
+        },
+        {
+            'name':            'ac3',
+            'encoder':         Encoders.ByName('ac3'),
+            'default_format':  'ac3',
+            'system':          False,
+        },
+        {
+            'name':            'pcm 16 bit',
+            'encoder':         Encoders.ByName('pcm_s16le'),
+            'default_format':  'wav',
+            'system':          False,
+        },
+    ]
+
+    for ap in set_audio_presets:
+        AudioPresets.Add(**ap)
+
+    set_video_presets = [
+        {
+            'name': 'No video',
+            'encoder': Encoders.ByName('No video'),
+            'default_format': '',
+            'system': True,
+        },
+        {
+            'name': 'Stream copy',
+            'encoder': Encoders.ByName('Video stream copy'),
+            'default_format': '',
+            'system': True,
+        },
+        {
+            'name': 'libx h264 420p cbr 8M slow',
+            'encoder': Encoders.ByName('libx264'),
+            'default_format': 'mp4',
+            'system': False,
+        },
+        {
+            'name': 'nv h264 420p Preset p6-Better',
+            'encoder': Encoders.ByName('h264_nvenc'),
+            'default_format': 'mp4',
+            'system': False,
+        },
+    ]
+
+    for vp in set_video_presets:
+        VideoPresets.Add(**vp)
+
+    UserPresets.Load()
+
+def is_headless(argv: list) -> bool:
+    # parsed the way cli parses them, so --watch=FOLDER and abbreviated flags count too
+    args, _ = arg_parser().parse_known_args(argv)
+    return args.batch or args.resume or len(args.watch) > 0
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='FEnc.py', description=f'{VERSION}. Starts the GUI unless a headless mode is given.')
+    parser.add_argument('files', nargs='*', help='source files, added to the sources list in GUI mode')
+    parser.add_argument('--batch', action='store_true', help='probe and encode the files without the GUI')
+    parser.add_argument('--resume', action='store_true', help='finish the unfinished jobs of the journal headless, with the presets they were queued with')
+    parser.add_argument('--journal', default=None, help=f'job journal file, {JobJournal.Filename} in the settings folder by default')
+    parser.add_argument('--watch', action='append', default=[], metavar='FOLDER', help='encode new files of this folder as they arrive, until interrupted, can be repeated')
+    parser.add_argument('--settle', type=float, default=WatchFolders.Settle, help='seconds a new or changed file must stay unchanged before it is probed')
+    parser.add_argument('--vpreset', default=None, help='video preset name for --batch and --watch')
+    parser.add_argument('--apreset', default=None, help='audio preset name for --batch and --watch')
+    parser.add_argument('--add-output', nargs=2, action='append', default=[], metavar=('VPRESET', 'APRESET'), help='extra output from the same decode, "-" leaves that stream out, can be repeated')
+    parser.add_argument('--out', default=None, help='output folder, by default "encoded" next to each source')
+    parser.add_argument('--workers', type=int, default=EncodeJobs.Workers, help='concurrent encode jobs')
+    parser.add_argument('--threads', type=int, default=EncodeJobs.ThreadBudget, help='threads shared by all running encodes, 0 leaves the ffmpeg defaults')
+    parser.add_argument('--max-load', type=float, default=EncodeJobs.MaxLoad, help='hold back new encodes above this load average, 0 disables')
+    parser.add_argument('--min-free-mb', type=int, default=EncodeJobs.MinFreeMemory // 2**20, help='hold back new encodes below this much free memory, 0 disables')
+    parser.add_argument('--incremental', action='store_true', help=f'skip sources whose outputs and {EncodeJobs.ManifestSuffix} manifests show they are up to date')
+    parser.add_argument('--hash-sources', action='store_true', help='fingerprint sources by content too, not only by size and mtime')
+    parser.add_argument('--segments', type=int, default=EncodeJobs.Segments, help='encode long videos and sequences in up to this many parallel parts')
+    parser.add_argument('--ffmpeg', default=None, help='folder with the ffmpeg and ffprobe executables')
+    parser.add_argument('--metrics', default=None, help='write timing spans and counters here at exit, Prometheus text for .prom files, JSON lines otherwise')
+    parser.add_argument('--log-dir', default=None, help=f'keep per-file log lines beyond the last {MediaLog.Lines} in this folder')
+    return parser
+
+def set_admission(args: argparse.Namespace):
+    EncodeJobs.ThreadBudget = args.threads
+    EncodeJobs.MaxLoad = args.max_load
+    EncodeJobs.MinFreeMemory = args.min_free_mb * 2**20
+
+def cli(argv: list) -> int:
+    global ffmpeg
+    args = arg_parser().parse_args(argv)
+    MediaLog.SpillDir = args.log_dir
+    Events.Subscribe(Event.LOG, console_log)
+    Events.Subscribe(Event.JOB_STATE, console_job)
+    Events.Subscribe(Event.JOB_PROGRESS, console_progress)
+    Events.Subscribe(Event.MEDIA_ADDED, lambda media: console_log(text='File', file=media.filename, end='added.'))
+    log(text=f'{VERSION} started headless.')
+    ffmpeg = FFmpeg(args.ffmpeg)
+    load_defaults()
+    EncodeJobs.Workers = max(1, args.workers)
+    EncodeJobs.Segments = args.segments
+    EncodeJobs.Incremental = args.incremental
+    EncodeJobs.HashSources = args.hash_sources
+    set_admission(args)
+    if args.resume:
+        JobJournal.Open(args.journal, rotate=False)
+        resumed = JobJournal.Resume()
+        log(text=f'Resuming {len(resumed)} unfinished jobs from', file=JobJournal.Path)
+        if len(resumed) == 0:
+            return 0
+        files = list(resumed)
+    else:
+        vpreset = VideoPresets.GetPresetByName(args.vpreset) if args.vpreset is not None else None
+        apreset = AudioPresets.ByName(args.apreset) if args.apreset is not None else None
+        if (args.vpreset is not None and vpreset is None) or (args.apreset is not None and apreset is None):
+            log(error='Unknown preset.', end=f'Video presets: {VideoPresets.NameList()}, audio presets: {AudioPresets.Names()}')
+            return 2
+        if vpreset is None and apreset is None:
+            log(error='No presets given, use --vpreset and/or --apreset.')
+            return 2
+        outputs = []
+        for vname, aname in args.add_output:
+            pair = (VideoPresets.GetPresetByName(vname) if vname != '-' else None, AudioPresets.ByName(aname) if aname != '-' else None)
+            if (vname != '-' and pair[0] is None) or (aname != '-' and pair[1] is None) or pair == (None, None):
+                log(error='Unknown preset in --add-output', end=f'{vname} {aname}')
+                return 2
+            outputs.append(pair)
+        unfinished = JobJournal.Open(args.journal)
+        if len(unfinished) > 0:
+            log(text=f'{len(unfinished)} unfinished jobs in the journal, --resume finishes them.')
+        files = args.files
+        if len(args.watch) > 0:
+            return watch(args, vpreset, apreset, outputs)
+
+    MediaFiles.ProbePool = ThreadPoolExecutor(max_workers=MediaFiles.ProbeWorkers, thread_name_prefix='probe')
+    for media in MediaFiles.ProbePool.map(lambda source: MediaFiles(*source), MediaFiles.Sources(files)):
+        if media is not None: media.Register()
+    if MediaFiles.Count() == 0:
+        log(error='No media to encode.')
+        return 1
+
+    jobs = []
+    for media in MediaFiles.Collection:
+        if args.resume:
+            source = os.path.abspath(media.origpath)
+            if source not in resumed:
+                continue # frames of a resumed sequence come back as the whole sequence
+            media.video_preset, media.audio_preset, outputs, media.out_dir = resumed[source]
+        else:
+            media.video_preset = vpreset
+            media.audio_preset = apreset
+            if args.out is not None: media.out_dir = args.out
+        media.outputs = list(outputs)
+        jobs.append(EncodeJobs.Add(media))
+    log(text=f'Running {len(jobs)} jobs on {EncodeJobs.Workers} workers...')
+    EncodeJobs.Start(jobs)
+    wait([job.future for job in jobs])
+    failed = len([job for job in jobs if job.state not in (JobState.DONE, JobState.SKIPPED)])
+    skipped = len([job for job in jobs if job.state == JobState.SKIPPED])
+    log(text=f'Encoding finished: {len(jobs) - failed} of {len(jobs)} jobs succeeded' + (f', {skipped} of them were up to date.' if skipped > 0 else '.'))
+    ProbeCache.Flush()
+    if args.metrics is not None:
+        Metrics.Save(args.metrics)
+        log(text='Metrics written to', file=args.metrics)
+    return 0 if failed == 0 else 1
+
+def watch(args: argparse.Namespace, vpreset: VideoPresets, apreset: AudioPresets, outputs: list) -> int:
+    # hot folder loop, files already in the folders count as new, --incremental skips what was encoded before
+    for folder in args.watch:
+        if not os.path.isdir(folder):
+            log(error='Not a folder:', file=folder)
+            return 2
+        if args.out is not None and os.path.abspath(folder) == os.path.abspath(args.out):
+            log(error='The output folder cannot be watched:', file=folder)
+            return 2
+        WatchFolders.Add(folder)
+    WatchFolders.Settle = args.settle
+    MediaFiles.ProbePool = ThreadPoolExecutor(max_workers=MediaFiles.ProbeWorkers, thread_name_prefix='probe')
+    log(text=f'Watching {len(WatchFolders.Collection)} folders', end='with inotify, Ctrl+C stops.' if WatchFolders.Inotify is not None else f'by polling every {WatchFolders.Poll:g}s, Ctrl+C stops.')
+    finished = {state: 0 for state in JobState}
+    try:
+        while True:
+            # finished jobs leave the collections, the daemon does not grow and a changed file can come again
+            for job in [x for x in EncodeJobs.Collection if x.future is not None and x.future.done()]:
+                finished[job.state] += 1
+                EncodeJobs.Collection.remove(job)
+                MediaFiles.Delete(job.media.filepath, quiet=True)
+            paths = WatchFolders.Settled()
+            if len(paths) > 0:
+                jobs = []
+                for media in MediaFiles.ProbePool.map(lambda source: MediaFiles(*source), MediaFiles.Sources(paths)):
+                    if media is None or not media.Register():
+                        continue
+                    media.video_preset = vpreset
+                    media.audio_preset = apreset
+                    media.outputs = list(outputs)
+                    if args.out is not None: media.out_dir = args.out
+                    jobs.append(EncodeJobs.Add(media))
+                if len(jobs) > 0:
+                    log(text=f'Queued {len(jobs)} new jobs.')
+                    EncodeJobs.Start(jobs)
+            WatchFolders.Wait()
+    except KeyboardInterrupt:
+        active = EncodeJobs.Active()
+        log(text=f'Watch stopped, waiting for {len(active)} jobs.', end='Interrupt again to cancel them.' if len(active) > 0 else None)
+        try:
+            wait([job.future for job in active])
+        except KeyboardInterrupt:
+            EncodeJobs.Cancel()
+            wait([job.future for job in active])
+    for job in EncodeJobs.Collection:
+        finished[job.state] += 1
+    log(text='Watch finished:', end=', '.join(f'{count} {state.doc.lower()}' for state, count in finished.items() if count > 0) + '.' if any(finished.values()) else 'nothing encoded.')
+    ProbeCache.Flush()
+    if args.metrics is not None:
+        Metrics.Save(args.metrics)
+        log(text='Metrics written to', file=args.metrics)
+    return 0